@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+
+ORM calls of async views should go through `contrib.db_pool.aio.run_in_pool`, so that they
+share the limits of the connection pool without blocking the event loop.
 """
 
 import os
@@ -1,12 +1,263 @@
-import json
+import time
 import logging
+import threading
+import contextvars
 
 from django.apps import apps
 from django.conf import settings
-from django.db import DatabaseError
+from django.db import DatabaseError, InterfaceError, OperationalError, connections
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
 
 logger = logging.getLogger("django")
 
+# {db_alias: sticky deadline(time.monotonic())}, reset at the start of every request
+_sticky_aliases = contextvars.ContextVar("db_router_sticky_aliases", default=None)
+
+
+def reset_sticky_aliases(**kwargs):
+    _sticky_aliases.set(None)
+
+
+request_started.connect(reset_sticky_aliases, dispatch_uid="db_router_reset_sticky_aliases")
+
+
+class ReplicaBalancer(object):
+    """ Choose one of the replicas of a master
+
+    policy:
+        weighted: smooth weighted round-robin(the same as nginx upstream)
+        least_outstanding: the replica with the least outstanding queries per weight
+    Replicas that fail(probe, connect or disconnect error) are ejected for `eject_seconds`.
+    """
+    # CR_CONNECTION_ERROR, CR_CONN_HOST_ERROR, CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_SERVER_LOST_EXTENDED
+    MYSQL_DISCONNECT_CODES = {2002, 2003, 2006, 2013, 2055}
+
+    # {alias: outstanding queries} / {alias: ejected deadline}, shared by all balancers of the process
+    outstanding = {}
+    ejected = {}
+    _lock = threading.Lock()
+
+    def __init__(self, replicas, policy="weighted", probe=None, eject_seconds=30):
+        self.replicas = replicas    # [(alias, weight), ...]
+        self.policy = policy
+        self.probe = probe
+        self.eject_seconds = eject_seconds
+        self._current_weights = {alias: 0 for alias, _ in replicas}
+
+    @classmethod
+    def eject(cls, alias, seconds):
+        logger.warning("DatabaseRouter replica<%s> ejected for %ss", alias, seconds)
+        cls.ejected[alias] = time.monotonic() + seconds
+
+    def is_available(self, alias):
+        deadline = self.ejected.get(alias)
+
+        if deadline is not None:
+            if deadline > time.monotonic():
+                return False
+            self.ejected.pop(alias, None)
+
+        if self.probe is not None and not self.probe.is_healthy(alias):
+            self.eject(alias, min(self.eject_seconds, self.probe.interval))
+            return False
+
+        return True
+
+    def choose(self):
+        """ Replica alias, None if no replica is available """
+        candidates = [(alias, weight) for alias, weight in self.replicas if self.is_available(alias)]
+
+        while candidates:
+            alias = self.pick(candidates)
+
+            if self.connect(alias):
+                return alias
+
+            candidates = [item for item in candidates if item[0] != alias]
+
+        return None
+
+    def pick(self, candidates):
+        if len(candidates) == 1:
+            return candidates[0][0]
+
+        if self.policy == "least_outstanding":
+            return min(candidates, key=lambda item: self.outstanding.get(item[0], 0) / item[1])[0]
+
+        with self._lock:
+            total, best = 0, None
+
+            for alias, weight in candidates:
+                self._current_weights[alias] += weight
+                total += weight
+
+                if best is None or self._current_weights[alias] > self._current_weights[best]:
+                    best = alias
+
+            self._current_weights[best] -= total
+
+        return best
+
+    def connect(self, alias):
+        """ Connect the chosen replica ahead of the query(no-op if this thread is connected already),
+        a refused/timed out connect ejects it, the execute wrapper never sees connect errors.
+        """
+        connection = connections[alias]
+
+        if connection.connection is not None:
+            return True
+
+        try:
+            connection.ensure_connection()
+        except (OperationalError, InterfaceError) as e:
+            logger.warning("DatabaseRouter replica<%s> connect failed: %s", alias, e)
+            self.eject(alias, self.eject_seconds)
+            return False
+
+        return True
+
+    @classmethod
+    def is_disconnect(cls, connection, error):
+        """ Only lost/refused connections eject a replica, not bad SQL, lock wait timeouts, etc. """
+        cause = error.__cause__ or error
+
+        if connection.vendor == "mysql":
+            return bool(cause.args) and cause.args[0] in cls.MYSQL_DISCONNECT_CODES
+
+        if isinstance(error, InterfaceError):
+            return True
+
+        # psycopg2: connection.closed is non-zero after the server connection is lost
+        dbapi_connection = getattr(connection, "dbapi_connection", connection.connection)
+        closed = getattr(dbapi_connection, "closed", None)
+
+        if closed is not None:
+            return bool(closed)
+
+        return not connection.is_usable()
+
+    @classmethod
+    def install_execute_wrapper(cls, replica_aliases, eject_seconds):
+        """ Count outstanding queries and eject replicas on disconnect errors """
+
+        def execute_wrapper(execute, sql, params, many, context):
+            alias = context["connection"].alias
+
+            with cls._lock:
+                cls.outstanding[alias] = cls.outstanding.get(alias, 0) + 1
+
+            try:
+                return execute(sql, params, many, context)
+            except (OperationalError, InterfaceError) as e:
+                cls.is_disconnect(context["connection"], e) and cls.eject(alias, eject_seconds)
+                raise
+            finally:
+                with cls._lock:
+                    cls.outstanding[alias] -= 1
+
+        def on_connection_created(sender, connection, **kwargs):
+            if connection.alias in replica_aliases and execute_wrapper not in connection.execute_wrappers:
+                connection.execute_wrappers.append(execute_wrapper)
+
+        connection_created.connect(on_connection_created, weak=False, dispatch_uid="db_router_replica_wrapper")
+
+
+class ReplicaProbe(object):
+    """ Replica health/lag probe, the result is cached for `interval` seconds per alias
+
+    The probe runs on its own short-lived connection with `timeout` seconds of connect/query timeout,
+    at most one probe is in flight per alias, other threads use the last known result meanwhile
+    (healthy before the first result).
+    """
+    LAG_SQL = {
+        "mysql": "SHOW SLAVE STATUS",
+        # pg_last_xact_replay_timestamp() stops moving on an idle primary, caught-up replicas report 0 lag
+        "postgresql": "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                      "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END",
+    }
+
+    def __init__(self, max_lag=None, interval=10, timeout=2):
+        self.max_lag = max_lag
+        self.interval = interval
+        self.timeout = timeout
+        self._results = {}      # {alias: (is_healthy, checked_at)}
+        self._probing = set()   # aliases with a probe in flight
+        self._lock = threading.Lock()
+
+    def get_connection_params(self, conn):
+        params = dict(conn.get_connection_params(), connect_timeout=self.timeout)
+
+        if conn.vendor == "mysql":
+            params.update(read_timeout=self.timeout)
+        elif conn.vendor == "postgresql":
+            timeout_option = "-c statement_timeout=%d" % (self.timeout * 1000)
+            params["options"] = " ".join(filter(None, [params.get("options"), timeout_option]))
+
+        return params
+
+    def get_lag(self, alias):
+        """ Seconds of replica lag, None if unknown """
+        conn = connections[alias]
+        sql = self.LAG_SQL.get(conn.vendor)
+        # DB-API connect directly, not through the (pooled) backend's get_new_connection
+        dbapi_connection = conn.Database.connect(**self.get_connection_params(conn))
+
+        try:
+            cursor = dbapi_connection.cursor()
+
+            if sql is None:
+                cursor.execute("SELECT 1")
+                return None
+
+            cursor.execute(sql)
+            row = cursor.fetchone()
+
+            if conn.vendor == "mysql":
+                columns = [col[0] for col in cursor.description or []]
+                row = row and dict(zip(columns, row)).get("Seconds_Behind_Master")
+            else:
+                row = row and row[0]
+        finally:
+            dbapi_connection.close()
+
+        return None if row is None else float(row)
+
+    def check(self, alias):
+        try:
+            lag = self.get_lag(alias)
+        except Exception as e:
+            logger.warning("DatabaseRouter replica<%s> probe failed: %s", alias, e)
+            return False
+
+        if self.max_lag is not None and lag is not None and lag > self.max_lag:
+            logger.warning("DatabaseRouter replica<%s> lag %.1fs > %ss", alias, lag, self.max_lag)
+            return False
+
+        return True
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        result = self._results.get(alias)
+
+        if result is not None and now - result[1] < self.interval:
+            return result[0]
+
+        with self._lock:
+            if alias in self._probing:
+                return True if result is None else result[0]
+
+            self._probing.add(alias)
+
+        try:
+            result = (self.check(alias), time.monotonic())
+            self._results[alias] = result
+        finally:
+            with self._lock:
+                self._probing.discard(alias)
+
+        return result[0]
+
 
 class DatabaseRouter(object):
     """ MySQL database replication arch or single.
@@ -23,6 +274,27 @@ class DatabaseRouter(object):
                 'user_slave': {...},
             }
 
+    Read after write:
+        After a write in a request, reads on that alias go to the master for
+        `DATABASE_ROUTER_STICKY_SECONDS` seconds(default 1, 0 means disabled).
+
+    Replica probe(optional):
+        DATABASE_ROUTER_REPLICA_PROBE = {'max_lag': 5, 'interval': 10, 'timeout': 2}
+        Reads fall back to the master when the replica is unreachable or lags more than `max_lag` seconds,
+        the probe gives up after `timeout` seconds.
+
+    Multiple replicas:
+        `app_name_slave` and/or `app_name_slave_1`..`app_name_slave_N`(`default_slave_N` alike) are discovered,
+        `WEIGHT` of each replica config is its weight(default 1):
+            DATABASES = {
+                'default': {...},
+                'default_slave_1': {..., 'WEIGHT': 3},
+                'default_slave_2': {..., 'WEIGHT': 1},
+            }
+
+        DATABASE_ROUTER_BALANCE_POLICY = 'weighted'         # or 'least_outstanding'
+        DATABASE_ROUTER_EJECT_SECONDS = 30                  # eject a failed replica for N seconds
+
     # Sharding:
     #     Evenly write data to DB by unique keys, also read data by unique keys.
     #
@@ -40,32 +312,44 @@ class DatabaseRouter(object):
     DATABASES_MAPPING = settings.DATABASES
     NO_LOGGING_APP_LABEL = ["silk", "django_celery_beat"]
 
+    def __init__(self):
+        self.sticky_seconds = getattr(settings, "DATABASE_ROUTER_STICKY_SECONDS", 1)
+
+        probe_options = getattr(settings, "DATABASE_ROUTER_REPLICA_PROBE", None)
+        self.replica_probe = ReplicaProbe(**probe_options) if probe_options else None
+
+        self.balance_policy = getattr(settings, "DATABASE_ROUTER_BALANCE_POLICY", "weighted")
+        self.eject_seconds = getattr(settings, "DATABASE_ROUTER_EJECT_SECONDS", 30)
+
     def db_for_write(self, model, **hints):
         """ Write Database """
-        app_label = model._meta.app_label
-        self._check_app_to_db_config(app_label)
+        alias = self._get_route(self.write_routes, model._meta.app_label)
+
+        if self.sticky_seconds:
+            sticky_aliases = _sticky_aliases.get()
+
+            if sticky_aliases is None:
+                sticky_aliases = {}
+                _sticky_aliases.set(sticky_aliases)
 
-        if settings.DEBUG and app_label not in self.NO_LOGGING_APP_LABEL:
-            logger.info("DatabaseRouter.db_for_write() => model use db: %s, app_label: %s\n"
-                        % (self.apps_router_mapping[app_label], app_label)
-                        )
+            sticky_aliases[alias] = time.monotonic() + self.sticky_seconds
 
-        return self.apps_router_mapping[app_label]
+        return alias
 
     def db_for_read(self, model, **hints):
         """ Read Database """
         app_label = model._meta.app_label
-        self._check_app_to_db_config(app_label)
+        balancer = self._get_route(self.read_routes, app_label)
+        db_master = self.write_routes[app_label]
 
-        app_label_slave = app_label + self.DEFAULT_SLAVE_ALIAS
-        self._check_app_to_db_config(app_label_slave)
+        if balancer is None:
+            return db_master
 
-        db_slave = self.apps_router_mapping[app_label] + self.DEFAULT_SLAVE_ALIAS
+        sticky_aliases = _sticky_aliases.get()
+        if sticky_aliases and sticky_aliases.get(db_master, 0) > time.monotonic():
+            return db_master
 
-        if settings.DEBUG and app_label not in self.NO_LOGGING_APP_LABEL:
-            logger.info("DatabaseRouter.db_for_read() => model use db: %s, app_label: %s\n" % (db_slave, app_label))
-
-        return db_slave
+        return balancer.choose() or db_master
 
     def allow_relation(self, obj1, obj2, **hint):
         """ Object whether to run the association operation """
@@ -97,11 +381,65 @@ class DatabaseRouter(object):
 
         return None
 
-    def _check_app_to_db_config(self, app_label):
+    def _get_route(self, routes, app_label):
         """ Check whether app_label is in settings.DATABASES configuration """
-        if app_label not in self.apps_router_mapping:
+        try:
+            return routes[app_label]
+        except KeyError:
             raise DatabaseError("`DATABASES` don't contain ['%s': {...}] config" % app_label)
 
+    @property
+    def write_routes(self):
+        """ Flat mapping: {'app1': 'default', ...} """
+        routes = self.__dict__.get("_write_routes")
+
+        if routes is None:
+            routes = self.__dict__["_write_routes"] = {
+                app_label: alias
+                for app_label, alias in self.apps_router_mapping.items()
+                if not app_label.endswith(self.DEFAULT_SLAVE_ALIAS)
+            }
+
+        return routes
+
+    def get_replicas(self, slave_alias):
+        """ [(alias, weight), ...] of `slave_alias` and `slave_alias_1`..`slave_alias_N` in settings.DATABASES """
+        numbered_aliases = [
+            alias for alias in self.DATABASES_MAPPING
+            if alias.startswith(slave_alias + "_") and alias[len(slave_alias) + 1:].isdigit()
+        ]
+        numbered_aliases.sort(key=lambda alias: int(alias[len(slave_alias) + 1:]))
+        aliases = ([slave_alias] if slave_alias in self.DATABASES_MAPPING else []) + numbered_aliases
+
+        return [(alias, max(int(self.DATABASES_MAPPING[alias].get("WEIGHT", 1)), 1)) for alias in aliases]
+
+    @property
+    def read_routes(self):
+        """ Flat mapping: {'app1': ReplicaBalancer, ...}, None means reading from master(no replica configured) """
+        routes = self.__dict__.get("_read_routes")
+
+        if routes is None:
+            routes, balancers = {}, {}
+
+            for app_label, alias in self.write_routes.items():
+                slave_alias = self.apps_router_mapping[app_label + self.DEFAULT_SLAVE_ALIAS]
+
+                if slave_alias not in balancers:
+                    replicas = self.get_replicas(slave_alias)
+                    balancers[slave_alias] = replicas and ReplicaBalancer(
+                        replicas, policy=self.balance_policy,
+                        probe=self.replica_probe, eject_seconds=self.eject_seconds,
+                    ) or None
+
+                routes[app_label] = balancers[slave_alias]
+
+            replica_aliases = {alias for b in balancers.values() if b for alias, _ in b.replicas}
+            replica_aliases and ReplicaBalancer.install_execute_wrapper(replica_aliases, self.eject_seconds)
+
+            self.__dict__["_read_routes"] = routes
+
+        return routes
+
     @property
     def apps_router_mapping(self):
         """ Get each app relation to model, default is `default` alias
@@ -132,4 +470,3 @@ class DatabaseRouter(object):
 
         setattr(self, "_apps_router_mapping", _apps_router_mapping)
         return _apps_router_mapping
-
@@ -208,7 +208,10 @@ STATIC_ROOT = str(BASE_DIR / "staticfiles")
 #
 #   存储到ALIYUN OSS, 速度更快(文件太多上传OSS慢啊), 暂不能配合Django-Compressor压缩
 #   "{APP_NAME}.contrib.storage.backends.aliyun.AliyunStaticStorage"
-STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
+#
+#   同 CompressedStaticFilesStorage, collectstatic 时生成 reload_javascript 的脚本清单
+#   "{APP_NAME}.core.staticfiles.ScriptManifestStaticFilesStorage"
+STATICFILES_STORAGE = APP_NAME + ".core.staticfiles.ScriptManifestStaticFilesStorage"
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#static-url
 # 对外提供WEB访问时的URL地址
@@ -220,6 +223,8 @@ STATICFILES_DIRS = [
     os.path.join(PROJECT_DIR, "staticfiles")
 ]
 COMPRESS_ENABLED = False
+# reload_javascript: 合并为一个内容哈希命名的脚本; 脚本清单在 collectstatic 时生成(ScriptManifestStaticFilesStorage)
+RELOAD_JAVASCRIPT_BUNDLE = False
 
 # https://docs.djangoproject.com/en/dev/ref/contrib/staticfiles/#staticfiles-finders
 STATICFILES_FINDERS = [
@@ -282,7 +287,8 @@ REST_FRAMEWORK = {
 
     "DEFAULT_RENDERER_CLASSES":
         (
-            "rest_framework.renderers.JSONRenderer",
+            # 渲染阶段包装统一响应格式 {code, errmsg, data}
+            APP_NAME + ".core.drf.renderers.ApiJSONRenderer",
         ),
 
     # EXCEPTION_HANDLER
@@ -348,6 +354,9 @@ mimetypes.add_type("application/javascript", ".js")
 # Auth Cookie
 AUTH_COOKIE_KEY = 'X-Auth'
 AUTH_COOKIE_SALT = 'KuXEudsJPz9kiUsNK3zGYCbVelkrKpa5'
+# 认证 Cookie 缓存: 进程内 LRU 大小与 TTL(秒), Redis 副本缓存至 token 过期
+AUTH_TOKEN_CACHE_SIZE = 1024
+AUTH_TOKEN_CACHE_LOCAL_TIMEOUT = 5
 
 
 # Other Config
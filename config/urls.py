@@ -27,3 +27,6 @@ urlpatterns += [
     for app in apps.app_configs.values()
     if app.path.startswith(str(settings.APPS_DIR))
 ]
+
+if apps.is_installed('contrib.db_pool'):
+    urlpatterns += [path(r"", include('contrib.db_pool.urls'))]
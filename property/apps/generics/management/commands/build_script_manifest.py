@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.staticfiles import script_manifest
+
+
+class Command(BaseCommand):
+    help = '重新生成 reload_javascript 的脚本清单(STATIC_ROOT/script-manifest.json), collectstatic 时已自动生成'
+
+    def handle(self, *args, **options):
+        manifest = script_manifest.write()
+        total = sum(len(paths) for paths in manifest.values())
+
+        self.stdout.write(self.style.SUCCESS(
+            '%s scripts in %s dirs => %s' % (total, len(manifest), script_manifest.manifest_path)
+        ))
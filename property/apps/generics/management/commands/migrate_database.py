@@ -0,0 +1,43 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core.db.migrate import MigrateDatabase
+
+
+class Command(BaseCommand):
+    help = '在两个数据库(settings.DATABASES 别名)之间迁移数据: 全量复制 / 增量同步 / 迁移计划'
+
+    def add_arguments(self, parser):
+        parser.add_argument('src', help='源数据库别名')
+        parser.add_argument('dest', help='目标数据库别名')
+        parser.add_argument('--models', nargs='*', default=None, help='app_label.ModelName, 默认全部')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--no-bulk-load', action='store_true', default=False, help='不使用 COPY / LOAD DATA')
+        parser.add_argument('--incremental', action='store_true', default=False, help='按 update_time 水位线增量同步')
+        parser.add_argument('--dry-run', action='store_true', default=False, help='只输出迁移计划: 行数与估计耗时')
+        parser.add_argument('--exact', action='store_true', default=False, help='dry-run 使用 COUNT(*) 精确行数')
+
+    def handle(self, *args, **options):
+        models = [apps.get_model(label) for label in options['models'] or []]
+        migration = MigrateDatabase(
+            options['src'], options['dest'], chunk_size=options['chunk_size'],
+            workers=options['workers'], bulk_load=not options['no_bulk_load'],
+        )
+
+        if options['dry_run']:
+            self.print_report(migration.dry_run(models, exact=options['exact']))
+        else:
+            migration.migrate(models, incremental=options['incremental'])
+
+    def print_report(self, report):
+        for cycle in report['cycles']:
+            self.stdout.write(self.style.WARNING('cyclic dependencies: %s' % ', '.join(cycle)))
+
+        for index, tables in enumerate(report['waves'], 1):
+            self.stdout.write('wave %s:' % index)
+
+            for item in tables:
+                self.stdout.write('    %-40s %12s rows  %10.1fs' % (item['table'], item['rows'], item['seconds']))
+
+        self.stdout.write('estimated: %.1fs' % report['seconds'])
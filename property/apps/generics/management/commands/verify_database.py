@@ -0,0 +1,29 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core.db.verify import ChecksumVerifier
+
+
+class Command(BaseCommand):
+    help = '校验两个数据库的数据是否一致: 按主键范围分块比较 (行数, 校验和), 只输出不一致的范围'
+
+    def add_arguments(self, parser):
+        parser.add_argument('src', help='源数据库别名')
+        parser.add_argument('dest', help='目标数据库别名')
+        parser.add_argument('--models', nargs='*', default=None, help='app_label.ModelName, 默认全部')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--resync', action='store_true', default=False, help='以源库为准重新同步不一致的范围')
+
+    def handle(self, *args, **options):
+        models = [apps.get_model(label) for label in options['models'] or []] or apps.get_models()
+        verifier = ChecksumVerifier(
+            options['src'], options['dest'], chunk_size=options['chunk_size'], workers=options['workers']
+        )
+        mismatches = verifier.verify(models, resync=options['resync'])
+
+        for item in mismatches:
+            self.stdout.write('%(table)s [%(lower)s, %(upper)s): src=%(src)s dest=%(dest)s' % item)
+
+        style = self.style.ERROR if mismatches else self.style.SUCCESS
+        self.stdout.write(style('%s mismatched ranges%s' % (len(mismatches), options['resync'] and ', resynced' or '')))
@@ -4,6 +4,12 @@ from . import views
 
 
 urlpatterns = [
+    re_path(
+        r"^generics/scripts/(?P<script_dirs>[\w,-]+)\.(?P<digest>[0-9a-f]+)\.js$",
+        view=views.ScriptBundleView.as_view(),
+        name="generics_script_bundle"
+    ),
+
     re_path(
         "^api/generics/template/(?P<template_name>.*?)$",
         view=views.GenericTemplateAPI.as_view(),
@@ -2,6 +2,10 @@ import os.path
 
 from django.apps import apps
 from django.conf import settings
+from django.urls import reverse
+from django.views.generic import View
+from django.utils.cache import patch_cache_control
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.views.generic.base import ContextMixin
 from django.template.response import TemplateResponse
 from django.template.exceptions import TemplateDoesNotExist
@@ -13,6 +17,7 @@ from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 
 from constant.action import ApiActionEnum
+from core.staticfiles import script_manifest
 
 from .util import get_model_class, get_serializer_class, Query
 from .serializers import GenericSearchSerializer, GenericDoOperationsSerializer
@@ -151,3 +156,23 @@ class GenericDoOperationsAPI(mixins.CreateModelMixin,
         return getattr(self, action)(request, *args, **kwargs, partial=True)
 
 
+class ScriptBundleView(View):
+    """ reload_javascript(bundle=True) 合并的脚本, URL 含内容哈希, 可永久缓存 """
+
+    def get(self, request, script_dirs, digest, *args, **kwargs):
+        requested_dirs = tuple(script_dirs.split(','))
+        script_dirs = script_manifest.normalize(requested_dirs)
+
+        if not script_dirs or set(requested_dirs) != set(script_dirs):
+            raise Http404
+
+        current_digest, content = script_manifest.get_bundle(script_dirs)
+
+        # 文件已更新(旧页面中的地址), 或目录顺序、重复与 reload_javascript 生成的地址不同
+        if digest != current_digest or requested_dirs != script_dirs:
+            url = reverse('generics_script_bundle', kwargs=dict(script_dirs=','.join(script_dirs), digest=current_digest))
+            return HttpResponseRedirect(url)
+
+        response = HttpResponse(content, content_type='application/javascript; charset=utf-8')
+        patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+        return response
@@ -10,6 +10,7 @@ class PermissionsConfig(AppConfig):
     verbose_name = '权限'
 
     def ready(self):
+        from . import signals  # noqa
         from .models import MenuModel, RoleGroupModel
 
         sys_desc = '系统载入'
@@ -0,0 +1,187 @@
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+__all__ = (
+    'LRUCache', 'PermissionVersion', 'MenuTreeCache', 'MenuAncestorIndex',
+    'permission_version', 'menu_tree_cache', 'menu_index_cache', 'menu_script_cache',
+)
+
+
+class LRUCache:
+    """ 进程内的 LRU 缓存(线程安全) """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PermissionVersion:
+    """ 权限版本号: 菜单、角色组及其关联变更时递增, 各 worker 据此懒加载重建缓存
+
+    共享版本号存放在 Django cache(Redis)中, 进程内最多每 {check_interval} 秒同步一次,
+    本进程内的变更立即生效
+    """
+    cache_key = 'permissions:version'
+
+    def __init__(self, check_interval=1.0):
+        self._version = None
+        self._checked_at = 0.0
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+
+        if self._version is None or now - self._checked_at >= self._check_interval:
+            with self._lock:
+                self._version = cache.get(self.cache_key) or 0
+                self._checked_at = now
+
+        return self._version
+
+    def bump(self):
+        cache.add(self.cache_key, 0, timeout=None)
+        version = cache.incr(self.cache_key)
+
+        with self._lock:
+            self._version = version
+            self._checked_at = time.monotonic()
+
+        return version
+
+
+class MenuTreeCache:
+    """ 菜单树缓存: 进程内 LRU + Redis 共享副本, 键为 (group_id, include_leaf, version)
+
+    缓存的菜单树为共享对象, 调用方只读, 不可修改
+    """
+    cache_key = 'permissions:menu_tree:%s:%s:%s'
+
+    def __init__(self, version, maxsize=128, timeout=24 * 60 * 60):
+        self._version = version
+        self._timeout = timeout
+        self._local = LRUCache(maxsize=maxsize)
+
+    def get_or_build(self, group_id, include_leaf, builder):
+        key = (group_id or 0, bool(include_leaf), self._version.get())
+        menu_tree = self._local.get(key)
+
+        if menu_tree is None:
+            redis_key = self.cache_key % key
+            menu_tree = cache.get(redis_key)
+
+            if menu_tree is None:
+                menu_tree = builder()
+                cache.set(redis_key, menu_tree, timeout=self._timeout)
+
+            self._local.set(key, menu_tree)
+
+        return menu_tree
+
+    def clear(self):
+        self._local.clear()
+
+
+class MenuAncestorIndex:
+    """ 菜单祖先闭包索引: 每个菜单的全部祖先(根在前), 层级与父路径均为 O(1) 读取
+
+    只包含未删除的菜单, 祖先链在已删除或不存在的父菜单处截断(同原递归 SQL)
+    """
+
+    def __init__(self, menus):
+        """
+        :param menus: iterable of (id, parent_id, name)
+        """
+        self._names = {}
+        self._parents = {}
+        self._ancestors = {}
+
+        for menu_id, parent_id, name in menus:
+            self._names[menu_id] = name
+            self._parents[menu_id] = parent_id
+
+        for menu_id in self._parents:
+            self._ancestors[menu_id] = self._build_ancestors(menu_id)
+
+    def _build_ancestors(self, menu_id):
+        chain, seen = [], {menu_id}
+        parent_id = self._parents[menu_id]
+
+        while parent_id in self._parents and parent_id not in seen:
+            if parent_id in self._ancestors:
+                return self._ancestors[parent_id] + (parent_id, ) + tuple(chain[::-1])
+
+            chain.append(parent_id)
+            seen.add(parent_id)
+            parent_id = self._parents[parent_id]
+
+        return tuple(chain[::-1])
+
+    def __contains__(self, menu_id):
+        return menu_id in self._ancestors
+
+    def get_ancestors(self, menu_id):
+        return self._ancestors.get(menu_id, ())
+
+    def get_ancestors_of_many(self, menu_ids):
+        ancestor_ids = set()
+
+        for menu_id in menu_ids:
+            ancestor_ids.update(self._ancestors.get(menu_id, ()))
+
+        return ancestor_ids
+
+    def get_level(self, menu_id):
+        return len(self._ancestors.get(menu_id, ()))
+
+    def get_child_level(self, parent_id):
+        """ 父菜单 {parent_id} 下子菜单的层级 """
+        if parent_id not in self._ancestors:
+            return 0
+
+        return self.get_level(parent_id) + 1
+
+    def get_parent_paths(self, menu_id):
+        return [self._names[ancestor_id] for ancestor_id in self._ancestors.get(menu_id, ())]
+
+
+permission_version = PermissionVersion(
+    check_interval=getattr(settings, 'PERMISSION_VERSION_CHECK_INTERVAL', 1.0)
+)
+menu_tree_cache = MenuTreeCache(
+    permission_version,
+    maxsize=getattr(settings, 'MENU_TREE_CACHE_SIZE', 128),
+    timeout=getattr(settings, 'MENU_TREE_CACHE_TIMEOUT', 24 * 60 * 60),
+)
+menu_index_cache = LRUCache(maxsize=4)
+# 菜单栏的菜单 JSON(bytes), 键为 (group_id, version)
+menu_script_cache = LRUCache(maxsize=getattr(settings, 'MENU_SCRIPT_CACHE_SIZE', 256))
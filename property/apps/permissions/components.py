@@ -0,0 +1,130 @@
+import re
+import json
+import time
+import logging
+import os.path
+import threading
+
+from django.conf import settings
+
+__all__ = ('ComponentIndex', 'component_index')
+
+logger = logging.getLogger('django')
+
+
+class ComponentIndex:
+    """ Vue 组件名 -> 组件路径 的索引
+
+    扫描 static/src/views 下的 js 文件, 结果保存到 JSON manifest 中(记录每个文件的 mtime),
+    文件的 mtime 变化时只重新读取变化的文件, 查询为 O(1)
+    """
+    COMPONENT_REGEX = re.compile(r"""Vue\.component\(['"](.*?)['"],\s*?\{""", re.S | re.M)
+
+    def __init__(self, manifest_file=None, check_interval=None):
+        self._manifest_file = manifest_file
+        self._check_interval = check_interval
+
+        self._files = None      # {relpath: [mtime, component_name]}
+        self._paths = {}        # {component_name: component_path}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def static_dir(self):
+        if settings.DEBUG:
+            static_dir = settings.STATICFILES_DIRS[0]
+        else:
+            static_dir = settings.STATIC_ROOT
+
+        return os.path.join(static_dir, 'src')
+
+    @property
+    def manifest_file(self):
+        return self._manifest_file or os.path.join(str(settings.BASE_DIR), '.component_manifest.json')
+
+    def _scan_mtimes(self):
+        """ 仅获取文件 mtime, 不读取文件内容; 遍历顺序与原 os.walk(topdown=False) 一致 """
+        static_dir = self.static_dir
+        file_mtimes = {}
+
+        for root, dirs, files in os.walk(os.path.join(static_dir, 'views'), topdown=False):
+            for filename in files:
+                filepath = os.path.join(root, filename)
+                relpath = filepath[len(static_dir) + 1:].replace(os.sep, '/')
+
+                try:
+                    file_mtimes[relpath] = os.stat(filepath).st_mtime
+                except OSError:
+                    continue
+
+        return file_mtimes
+
+    def _read_component_name(self, relpath):
+        try:
+            with open(os.path.join(self.static_dir, relpath), encoding='utf-8') as fp:
+                match = self.COMPONENT_REGEX.search(fp.read())
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        return match and match.group(1)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_file, encoding='utf-8') as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get('static_dir') != self.static_dir:
+            return {}
+
+        return manifest.get('files') or {}
+
+    def _save_manifest(self, files):
+        manifest = dict(static_dir=self.static_dir, files=files)
+
+        try:
+            with open(self.manifest_file, 'w', encoding='utf-8') as fp:
+                json.dump(manifest, fp, separators=(',', ':'))
+        except OSError as e:
+            logger.warning('ComponentIndex manifest<%s> save failed: %s', self.manifest_file, e)
+
+    def build(self, force=False):
+        """ 构建索引, 只重新读取 mtime 变化的文件 """
+        with self._lock:
+            old_files = {} if force else (self._files if self._files is not None else self._load_manifest())
+            files, changed = {}, force
+
+            for relpath, mtime in self._scan_mtimes().items():
+                item = old_files.get(relpath)
+
+                if item is None or item[0] != mtime:
+                    item, changed = [mtime, self._read_component_name(relpath)], True
+
+                files[relpath] = item
+
+            changed = changed or len(files) != len(old_files)
+
+            paths = {}
+            for relpath, (mtime, component_name) in files.items():
+                component_name and paths.setdefault(component_name, '../' + relpath)
+
+            self._files, self._paths = files, paths
+            self._checked_at = time.monotonic()
+            changed and self._save_manifest(files)
+
+        return paths
+
+    def get(self, component_name, default=''):
+        interval = self._check_interval
+
+        if self._files is None or (interval is not None and time.monotonic() - self._checked_at >= interval):
+            self.build()
+
+        return self._paths.get(component_name, default)
+
+
+component_index = ComponentIndex(
+    manifest_file=getattr(settings, 'COMPONENT_MANIFEST_FILE', None),
+    check_interval=getattr(settings, 'COMPONENT_INDEX_CHECK_INTERVAL', 5),
+)
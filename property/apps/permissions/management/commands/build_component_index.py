@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from permissions.components import component_index
+
+
+class Command(BaseCommand):
+    help = '构建 Vue 组件名 -> 组件路径 的索引 manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', default=False, help='忽略已有 manifest, 全量重建')
+
+    def handle(self, *args, **options):
+        paths = component_index.build(force=options['force'])
+        self.stdout.write('%s components indexed into %s' % (len(paths), component_index.manifest_file))
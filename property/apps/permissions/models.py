@@ -1,17 +1,16 @@
-import re
 import random
 import string
 import logging
-import os.path
 from collections import deque
 from typing import List, Union
 
 from django.db import models
-from django.conf import settings
 from django.core import validators
 from django.contrib.auth import get_user_model
 
 from core.db.base import BaseModelMixin
+from .cache import permission_version, menu_tree_cache, menu_index_cache, MenuAncestorIndex
+from .components import component_index
 
 UserModel = get_user_model()
 
@@ -57,29 +56,16 @@ class MenuModel(BaseModelMixin):
     def get_component_path(self, component_name=None):
         """ 获取组件路径， 默认匹配 self.component_name 路径 """
         component_name = (component_name or self.component_name or "").strip()
-        regex = re.compile(r"""Vue\.component\(['"](.*?)['"],\s*?\{""", re.S | re.M)
 
         if not component_name:
             return ''
 
-        if settings.DEBUG:
-            static_dir = settings.STATICFILES_DIRS[0]
-        else:
-            static_dir = settings.STATIC_ROOT
-        static_dir = os.path.join(static_dir, 'src')
+        component_path = component_index.get(component_name)
 
-        for root, dirs, files in os.walk(os.path.join(static_dir, 'views'), topdown=False):
-            for filename in files:
-                with open(os.path.join(root, filename), encoding='utf-8') as fp:
-                    text = fp.read()
-                    match = regex.search(text)
+        if not component_path:
+            logging.error('组件<%s:%s>文件不存在', self.name, component_name)
 
-                    if match is not None and match.group(1) == component_name:
-                        component_path = os.path.join(root[len(static_dir) + 1:], filename)
-                        return '../' + component_path.replace(os.sep, '/')
-
-        logging.error('组件<%s:%s>文件不存在', self.name, component_name)
-        return ''
+        return component_path
 
     @classmethod
     def get_menu_root_id(cls):
@@ -87,8 +73,42 @@ class MenuModel(BaseModelMixin):
         return root.id
 
     @classmethod
-    def get_menu_tree(cls, queryset=None, include_leaf: bool = True):
-        """ 菜单树
+    def get_ancestor_index(cls) -> MenuAncestorIndex:
+        """ 菜单祖先闭包索引(按权限版本缓存, 菜单保存/删除后自动重建) """
+        version = permission_version.get()
+        ancestor_index = menu_index_cache.get(version)
+
+        if ancestor_index is None:
+            menus = cls.objects.filter(is_del=False).order_by().values_list('id', 'parent_id', 'name')
+            ancestor_index = MenuAncestorIndex(menus)
+            menu_index_cache.set(version, ancestor_index)
+
+        return ancestor_index
+
+    @classmethod
+    def get_menu_tree(cls, queryset=None, include_leaf: bool = True, group_id: Union[int, None] = None):
+        """ 菜单树(按权限版本缓存, 返回的菜单树只读)
+        :param queryset: 可选，自定义的菜单集(不缓存)
+        :param include_leaf: bool, 是否包含叶子菜单
+        :param group_id: 可选，用户组ID, 为空时为全部菜单
+        :return:
+        """
+        if queryset is not None:
+            return cls.build_menu_tree(queryset=queryset, include_leaf=include_leaf)
+
+        def builder():
+            menu_queryset = None
+
+            if group_id:
+                menu_queryset = cls.objects.filter(roles__id=group_id, roles__is_del=False, is_del=False).all()
+
+            return cls.build_menu_tree(queryset=menu_queryset, include_leaf=include_leaf)
+
+        return menu_tree_cache.get_or_build(group_id, include_leaf, builder)
+
+    @classmethod
+    def build_menu_tree(cls, queryset=None, include_leaf: bool = True):
+        """ 构建菜单树
         :param queryset: 可选，用户组的菜单集
         :param include_leaf: bool, 是否包含叶子菜单
         :return:
@@ -99,8 +119,8 @@ class MenuModel(BaseModelMixin):
         if queryset is None:
             queryset = cls.objects.filter(is_del=False).all()
 
-        for menu in queryset:
-            menu_item = {attr: getattr(menu, attr) for attr in fields}
+        for row in queryset.values_list(*fields):
+            menu_item = dict(zip(fields, row))
 
             menu_id = menu_item['id']
             parent_id = menu_item['parent_id']
@@ -172,63 +192,19 @@ class RoleGroupModel(BaseModelMixin):
         return user_queryset
 
     def get_menu_tree_of_group(self):
-        return MenuModel.get_menu_tree(queryset=self.get_menus())
+        return MenuModel.get_menu_tree(group_id=self.id)
 
     @classmethod
     def get_group_list(cls, user_id: int, first_id: Union[int, None] = None) -> List[dict]:
         """ 获取用户所有的用户组权限 """
-        group_list = []
-        user = UserModel.objects.get(id=user_id or 0, is_del=False)
-        queryset = user.roles.filter(is_del=False).all()
-
-        for obj in queryset:
-            group_id = obj.id
-            item = dict(id=group_id, name=obj.name)
-
-            if group_id == first_id:
-                group_list.insert(0, item)
-            else:
-                group_list.append(item)
-
-        return group_list
+        from .resolver import resolve_permissions
+        return resolve_permissions(user_id).get_group_list(first_id=first_id)
 
     @classmethod
     def get_menu_permissions(cls, user_id: int, group_id: Union[int, None] = None):
         """ 反向查询: 获取当前用户对应的角色菜单组 """
-        user = UserModel.objects.get(id=user_id or 0, is_del=False)
-
-        group_query = dict(is_del=False)
-        group_id and group_query.update(id=group_id)
-        group_queryset = user.roles.filter(**group_query).all()
-
-        role_group_obj = group_queryset.first()
-        exclude_fields = ['level', 'menu_order', 'remark']
-
-        if role_group_obj:
-            menu_list = [
-                dict(
-                    menu.to_dict(exclude=exclude_fields),
-                    component_path=menu.get_component_path(),
-                    form_component_path=menu.get_component_path(menu.form_component_name)
-                )
-                for menu in role_group_obj.get_menus()
-            ]
-            menu_map = {menu_item['id']: menu_item for menu_item in menu_list}
-
-            for menu_item in menu_list:
-                menu_item.pop('id')
-                parent_id = menu_item.pop('parent_id')
-                parent_id and menu_map[parent_id].setdefault('models', []).append(menu_item)
-        else:
-            group_id, menu_map = 0, {}
-
-        root_menu_id = MenuModel.get_menu_root_id()
-        menus_config = dict(
-            system_keep=True, dynamic=True, group_id=group_id,
-            menus=menu_map.get(root_menu_id, {}).get('models', []),
-        )
-
-        return menus_config
+        from .resolver import resolve_permissions
+        return resolve_permissions(user_id).get_menu_permissions(group_id=group_id)
 
     def update_users_or_menus(self, user_ids: Union[List[int], None] = None, menu_ids: Union[List[int], None] = None):
         """ 更新用户或菜单 """
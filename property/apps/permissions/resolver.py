@@ -0,0 +1,161 @@
+import json
+from typing import List, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Subquery
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .cache import permission_version, menu_script_cache
+from .components import component_index
+from .models import MenuModel, RoleGroupModel
+
+__all__ = ('UserPermissions', 'resolve_permissions', 'invalidate_user_permissions', 'handler_eid', 'get_menus_script')
+
+UserModel = get_user_model()
+
+
+class UserPermissions:
+    """ 用户的角色组及各角色组菜单(按权限版本缓存的纯数据) """
+    cache_key = 'permissions:user:%s:%s'
+    cache_timeout = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60 * 60)
+    menu_fields = tuple(MenuModel.fields(exclude=['level', 'menu_order', 'remark']))
+
+    def __init__(self, user_id: int, groups: List[dict], group_menus: dict, root_menu_id: Union[int, None]):
+        self.user_id = user_id
+        self.groups = groups                # [{'id': 1, 'name': '超级管理员'}, ...], 顺序同 user.roles
+        self.group_menus = group_menus      # {group_id: [menu_item, ...]}, 顺序同 MenuModel.Meta.ordering
+        self.root_menu_id = root_menu_id
+
+    @classmethod
+    def load(cls, user_id: int):
+        """ 三次查询: 用户(含根菜单ID, 用户不存在或已删除时 raise DoesNotExist) + 用户角色组 + 角色组的全部菜单 """
+        root_menu_query = MenuModel.objects.filter(name='根', is_del=False).values('id')[:1]
+        root_menu_id = UserModel.objects\
+            .filter(id=user_id or 0, is_del=False)\
+            .annotate(root_menu_id=Subquery(root_menu_query))\
+            .values_list('root_menu_id', flat=True)\
+            .get()
+
+        groups = list(
+            RoleGroupModel.objects.filter(users__id=user_id, is_del=False).values('id', 'name')
+        )
+        group_menus = {group['id']: [] for group in groups}
+
+        if group_menus:
+            menu_queryset = MenuModel.objects\
+                .filter(roles__id__in=list(group_menus), is_del=False)\
+                .annotate(role_group_id=F('roles__id'))\
+                .values('role_group_id', *cls.menu_fields)
+
+            for menu_item in menu_queryset:
+                group_menus[menu_item.pop('role_group_id')].append(menu_item)
+
+        return cls(user_id, groups, group_menus, root_menu_id)
+
+    def to_cache(self):
+        return dict(user_id=self.user_id, groups=self.groups,
+                    group_menus=self.group_menus, root_menu_id=self.root_menu_id)
+
+    def get_group_list(self, first_id: Union[int, None] = None) -> List[dict]:
+        """ 用户所有的用户组, {first_id} 排在最前 """
+        group_list = []
+
+        for group in self.groups:
+            item = dict(group)
+
+            if item['id'] == first_id:
+                group_list.insert(0, item)
+            else:
+                group_list.append(item)
+
+        return group_list
+
+    def get_group_id(self, group_id: Union[int, None] = None) -> int:
+        """ 实际使用的角色组, 未指定 {group_id} 时取第一个角色组, 不属于该用户时为 0 """
+        if group_id:
+            return group_id if group_id in self.group_menus else 0
+
+        return self.groups[0]['id'] if self.groups else 0
+
+    def get_menu_permissions(self, group_id: Union[int, None] = None) -> dict:
+        """ 当前用户对应角色组的菜单配置, 未指定 {group_id} 时取第一个角色组 """
+        group_id = self.get_group_id(group_id)
+        menu_items = self.group_menus.get(group_id)
+
+        if menu_items is not None:
+            menu_list = [
+                dict(
+                    menu_item,
+                    component_path=component_index.get(menu_item['component_name'] or ''),
+                    form_component_path=component_index.get(menu_item['form_component_name'] or '')
+                )
+                for menu_item in menu_items
+            ]
+            menu_map = {menu_item['id']: menu_item for menu_item in menu_list}
+
+            for menu_item in menu_list:
+                menu_item.pop('id')
+                parent_id = menu_item.pop('parent_id')
+                parent_id in menu_map and menu_map[parent_id].setdefault('models', []).append(menu_item)
+        else:
+            group_id, menu_map = 0, {}
+
+        return dict(
+            system_keep=True, dynamic=True, group_id=group_id,
+            menus=menu_map.get(self.root_menu_id, {}).get('models', []),
+        )
+
+
+def resolve_permissions(user_id: int) -> UserPermissions:
+    """ 获取用户权限, 按 (user_id, 权限版本) 缓存到 Django cache """
+    key = UserPermissions.cache_key % (user_id or 0, permission_version.get())
+    data = cache.get(key)
+
+    if data is None:
+        permissions = UserPermissions.load(user_id)
+        cache.set(key, permissions.to_cache(), timeout=UserPermissions.cache_timeout)
+        return permissions
+
+    return UserPermissions(**data)
+
+
+def invalidate_user_permissions(*user_ids):
+    """ 删除用户当前权限版本的缓存(用户信息变更, 例如 is_del) """
+    version = permission_version.get()
+    cache.delete_many([UserPermissions.cache_key % (user_id, version) for user_id in user_ids])
+
+
+def handler_eid(data, eid):
+    """ 给每个菜单增加一个唯一标识，用于tab页判断 """
+    for i in data:
+        eid += 1
+        i['eid'] = eid
+        if 'models' in i:
+            eid = handler_eid(i.get('models'), eid)
+    return eid
+
+
+def get_menus_script(user_id: int, group_id: Union[int, None] = None) -> Tuple[bytes, bytes]:
+    """ 左侧菜单栏: (菜单 JSON, 脚本 var menus=...;var userGroups=...;var currentGroupId=...;)
+
+    菜单部分只与角色组有关, 按 (group_id, 权限版本) 缓存序列化后的 bytes, 用户的角色组列表每次生成(很小)
+    """
+    permissions = resolve_permissions(user_id=user_id)
+    group_id = permissions.get_group_id(group_id)
+    key = (group_id, permission_version.get())
+    menus_json = menu_script_cache.get(key)
+
+    if menus_json is None:
+        menus_data = permissions.get_menu_permissions(group_id=group_id)['menus']
+        handler_eid(menus_data, 1000)
+        menus_json = json.dumps(menus_data, cls=DjangoJSONEncoder).encode('utf-8')
+        menu_script_cache.set(key, menus_json)
+
+    groups = permissions.get_group_list(first_id=group_id)
+    script = 'var menus={menus};var userGroups={groups};var currentGroupId={group_id};'.format(
+        menus=menus_json.decode('utf-8'), groups=json.dumps(groups, cls=DjangoJSONEncoder), group_id=group_id
+    )
+
+    return menus_json, script.encode('utf-8')
@@ -1,4 +1,4 @@
-from django.db import connection
+from django.db import models
 from django.db.models import Q
 from django.utils.functional import cached_property
 from rest_framework import serializers
@@ -7,73 +7,75 @@ from .models import RoleGroupModel, MenuModel
 from users.serializers import SimpleUsersSerializer
 
 
+def get_menu_role_groups(menu_ids):
+    """ 一次查询获取菜单所属的全部角色组: {menu_id: [{'id': 1, 'name': '超级管理员'}, ...]} """
+    role_groups = {}
+
+    if not menu_ids:
+        return role_groups
+
+    group_queryset = RoleGroupModel.objects\
+        .filter(menus__in=menu_ids, is_del=False)\
+        .order_by('id')\
+        .values_list('menus', 'id', 'name')
+
+    for menu_id, group_id, group_name in group_queryset:
+        role_groups.setdefault(menu_id, []).append(dict(id=group_id, name=group_name))
+
+    return role_groups
+
+
+class MenuListSerializer(serializers.ListSerializer):
+    """ 列表序列化: 只为当前页的菜单批量计算所属角色组 """
+
+    def to_representation(self, data):
+        menu_objects = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.role_groups = get_menu_role_groups([menu_obj.id for menu_obj in menu_objects])
+
+        return super().to_representation(menu_objects)
+
+
 class MenuSerializer(serializers.ModelSerializer):
     # level: 展示名字，而不是数字
     level = serializers.CharField(source='get_level_display', read_only=True, max_length=100, help_text="层级")
     parent_paths = serializers.SerializerMethodField()
     group_id = serializers.SerializerMethodField()
     group_name = serializers.SerializerMethodField()
+    groups = serializers.SerializerMethodField()
 
     class Meta:
         model = MenuModel
-        fields = model.fields() + ['parent_paths', 'group_id', 'group_name']
-
-    @cached_property
-    def root_menu_tree(self):
-        return self.Meta.model.get_menu_tree()
+        fields = model.fields() + ['parent_paths', 'group_id', 'group_name', 'groups']
+        list_serializer_class = MenuListSerializer
 
     @cached_property
-    def menu_parent_paths(self):
-        # 计算菜单的父路径
-        menu_parent_dict = {}
-        stack = [self.root_menu_tree]
-
-        while stack:
-            menu = stack.pop(0)
-            menu_parent_dict[menu['id']] = ' / '.join(menu['parent_paths'])
-            stack.extend(menu.get('children') or [])
-
-        return menu_parent_dict
+    def ancestor_index(self):
+        return self.Meta.model.get_ancestor_index()
 
     def get_parent_paths(self, obj):
-        return self.menu_parent_paths.get(obj.id, '')
+        return ' / '.join(self.ancestor_index.get_parent_paths(obj.id))
 
     @cached_property
     def role_groups(self):
+        # 单个菜单序列化; 列表序列化由 MenuListSerializer 批量设置
         objects = self.instance or []
         menu_ids = [menu_obj.id for menu_obj in (objects if isinstance(objects, list) else [objects])]
 
-        fields = ['menus', 'name', 'id']
-        query = dict(menus__in=menu_ids, is_del=False)
-        group_queryset = RoleGroupModel.objects.filter(**query).prefetch_related('menus').values(*fields)
+        return get_menu_role_groups(menu_ids)
 
-        return {g.pop('menus'): g for g in group_queryset}
+    def get_groups(self, obj):
+        return self.role_groups.get(obj.id, [])
 
     def get_group_name(self, obj):
-        return self.role_groups.get(obj.id, {}).get('name')
+        groups = self.get_groups(obj)
+        return groups[0]['name'] if groups else None
 
     def get_group_id(self, obj):
-        return self.role_groups.get(obj.id, {}).get('id')
-
-    def _get_levels(self, menu_id):
-        sql = """
-            WITH RECURSIVE recursive_tree AS 
-                (
-                    SELECT id, NAME, parent_id FROM {tb}
-                    WHERE id={menu_id} AND is_del=False
-                    UNION 
-                    SELECT parent.id, parent.NAME, parent.parent_id FROM {tb} parent
-                    INNER JOIN recursive_tree child
-                    ON child.parent_id = parent.id 
-                    WHERE parent.is_del=false
-                )
-             SELECT COUNT(*) FROM recursive_tree WHERE id<>{menu_id}
-        """
-        cursor = connection.cursor()
-        cursor.execute(sql.format(tb=self.Meta.model._meta.db_table, menu_id=menu_id))
-        db_ret = cursor.fetchone()
-
-        return db_ret and db_ret[0] or 0
+        groups = self.get_groups(obj)
+        return groups[0]['id'] if groups else None
+
+    def _get_levels(self, parent_id):
+        return self.Meta.model.get_ancestor_index().get_child_level(parent_id)
 
     def renew_menu_position_and_group(self, instance):
         """ 调整同级菜单位置顺序和renew """
@@ -88,7 +90,7 @@ class MenuSerializer(serializers.ModelSerializer):
             instance.delete()
             raise ValueError('菜单<name:%s>不属于同一个父菜单' % instance.name)
 
-        instance.level = self._get_levels(menu_id=instance.id)
+        instance.level = self._get_levels(parent_id=instance.parent_id)
         instance.save()
 
         menu_children = menu_position['children']
@@ -109,7 +111,7 @@ class MenuSerializer(serializers.ModelSerializer):
         role_group and role_group.menus.add(instance)
 
         delete_ids = [o.id for o in db_menu_children_dict.values()]
-        Model.objects.filter(id__in=delete_ids).update(is_del=True)
+        Model.objects.filter(id__in=delete_ids).soft_delete()
 
     def create(self, validated_data):
         instance = super().create(validated_data)
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from core.db.signals import post_bulk_update
+
+from .cache import permission_version
+from .models import MenuModel, RoleGroupModel, GroupOwnedMenuModel, GroupOwnedUserModel
+from .resolver import invalidate_user_permissions
+
+UserModel = get_user_model()
+
+
+def invalidate_permissions():
+    """ 事务提交后递增权限版本号, 避免其他 worker 读到未提交的数据并缓存 """
+    transaction.on_commit(permission_version.bump)
+
+
+@receiver(post_save, sender=MenuModel)
+@receiver(post_delete, sender=MenuModel)
+@receiver(post_bulk_update, sender=MenuModel)
+@receiver(post_bulk_update, sender=RoleGroupModel)
+@receiver(post_save, sender=RoleGroupModel)
+@receiver(post_delete, sender=RoleGroupModel)
+@receiver(post_save, sender=GroupOwnedMenuModel)
+@receiver(post_delete, sender=GroupOwnedMenuModel)
+@receiver(post_save, sender=GroupOwnedUserModel)
+@receiver(post_delete, sender=GroupOwnedUserModel)
+def on_permissions_changed(sender, **kwargs):
+    invalidate_permissions()
+
+
+@receiver(m2m_changed, sender=RoleGroupModel.menus.through)
+@receiver(m2m_changed, sender=RoleGroupModel.users.through)
+def on_group_members_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_permissions()
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+def on_user_changed(sender, instance, update_fields=None, **kwargs):
+    """ 用户删除或 is_del 变更后, 丢弃该用户缓存的权限(只更新 last_login 等字段时不处理) """
+    if update_fields is None or 'is_del' in update_fields:
+        # post_delete 之后 instance.pk 会被置为 None, 提交前先取出
+        pk = instance.pk
+        transaction.on_commit(lambda: invalidate_user_permissions(pk))
+
+
+@receiver(post_bulk_update, sender=UserModel)
+def on_users_bulk_updated(sender, pks, changes, **kwargs):
+    """ UserModel.objects(UsersManager) 的 bulk_update_attrs/soft_delete """
+    if 'is_del' in changes:
+        transaction.on_commit(lambda: invalidate_user_permissions(*pks))
@@ -6,6 +6,12 @@ from . import views
 urlpatterns = [
     re_path("^api/permissions/menu/list$", view=views.ListMenuApi.as_view(), name="permissions_menu_list_api"),
     re_path("^api/permissions/menu/tree$", view=views.MenuTreeApi.as_view(), name="permissions_menu_tree_api"),
+    re_path(
+        "^api/permissions/user/menus$",
+        view=views.UserPermissionsApi.as_view(),
+        name="permissions_user_menus_api"
+    ),
+    re_path(r"^permissions/menus\.js$", view=views.MenusScriptView.as_view(), name="permissions_menus_script"),
     re_path(
         "^api/permissions/menu/operations$",
         view=views.OperationsMenuApi.as_view(),
@@ -1,12 +1,19 @@
-from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse
+from django.views.generic import View
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from rest_framework.views import APIView
 from rest_framework.generics import mixins, GenericAPIView
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 
-from .models import MenuModel, RoleGroupModel
+from .models import MenuModel
 from .serializers import MenuSerializer, RoleGroupSerializer
+from .cache import permission_version
+from .resolver import resolve_permissions, get_menus_script
 from constant.action import ApiActionEnum
 
 
@@ -16,58 +23,65 @@ class ListMenuApi(ListAPIView):
     def get_queryset(self):
         keyword = self.request.query_params.get('keyword')
         Model = self.serializer_class.Meta.model
-        fields = Model.fields()
+        queryset = Model.objects.filter(is_del=False).all()
 
         if keyword:
-            recursive_kwargs = dict(
-                key=keyword, menu_table=Model._meta.db_table,
-                menu_fields=', '.join(fields),
-                parent_menu_fields=', '.join(['parent.%s' % f for f in fields]),
-            )
-
-            # recursive query
-            sql = """
-                WITH RECURSIVE recursive_tree AS 
-                (
-                    SELECT {menu_fields} FROM {menu_table} 
-                    WHERE (name like '%{key}%' or url like '%{key}%') and is_del=false
-                    UNION 
-                    SELECT {parent_menu_fields} FROM {menu_table} parent
-                    INNER JOIN recursive_tree child
-                    ON child.parent_id = parent.id 
-                    WHERE parent.is_del=false
-                )
-                SELECT {menu_fields} FROM recursive_tree 
-                ORDER BY parent_id, level, menu_order
-            """
-            cursor = connection.cursor()
-            cursor.execute(sql.format(**recursive_kwargs))
-            db_menu_tree_rets = cursor.fetchall()
-
-            queryset = [Model(**dict(zip(fields, items))) for items in db_menu_tree_rets]
-        else:
-            queryset = Model.objects.filter(is_del=False).all()
+            # 匹配的菜单及其全部祖先菜单(祖先由闭包索引获取, 无需递归查询)
+            match_query = Q(name__icontains=keyword) | Q(url__icontains=keyword)
+            menu_ids = set(queryset.filter(match_query).values_list('id', flat=True))
+            menu_ids |= Model.get_ancestor_index().get_ancestors_of_many(menu_ids)
+
+            queryset = queryset.filter(id__in=menu_ids).order_by('parent_id', 'level', 'menu_order')
 
         return queryset
 
 
 class MenuTreeApi(APIView):
     def get(self, request, *args, **kwargs):
-        menu_queryset = None
         include_leaf = request.query_params.get('include_leaf')
         group_id = int(request.query_params.get('group_id', 0))
 
-        if group_id:
-            role_obj = RoleGroupModel.objects.filter(id=group_id, is_del=False).first()
-            menu_queryset = role_obj.get_menus()
-
         menu_tree = MenuModel.get_menu_tree(
-            queryset=menu_queryset,
+            group_id=group_id,
             include_leaf=include_leaf == 'true'
         )
         return Response(data=menu_tree)
 
 
+class UserPermissionsApi(APIView):
+    def get(self, request, *args, **kwargs):
+        """ 当前用户的角色组及菜单权限 """
+        permissions = resolve_permissions(user_id=request.user.id)
+        menus_config = permissions.get_menu_permissions(
+            group_id=int(request.query_params.get('group_id') or request.COOKIES.get('cgid') or 0)
+        )
+        menus_config.update(groups=permissions.get_group_list(first_id=menus_config['group_id']))
+
+        return Response(data=menus_config)
+
+
+def get_request_group_id(request):
+    return int(request.GET.get('group_id') or request.COOKIES.get('cgid') or 0)
+
+
+def menus_script_etag(request, *args, **kwargs):
+    """ 用户、角色组或菜单变更时权限版本号递增, ETag 随之变化 """
+    return 'menus-%s-%s-%s' % (request.user.id or 0, get_request_group_id(request), permission_version.get())
+
+
+class MenusScriptView(View):
+    """ 左侧菜单栏脚本(同 simple tag: menus), 支持 ETag/304 """
+
+    @method_decorator(condition(etag_func=menus_script_etag))
+    def get(self, request, *args, **kwargs):
+        _, script = get_menus_script(user_id=request.user.id, group_id=get_request_group_id(request))
+        response = HttpResponse(script, content_type='application/javascript; charset=utf-8')
+
+        # 每次使用前向服务器确认(304), 只在浏览器中缓存
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class OperationsMenuApi(mixins.CreateModelMixin,
                         mixins.UpdateModelMixin,
                         GenericAPIView):
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:02
+
+from django.db import migrations
+import users.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_alter_usersmodel_options"),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name="usersmodel",
+            managers=[
+                ("objects", users.models.UsersManager()),
+            ],
+        ),
+    ]
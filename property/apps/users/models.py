@@ -3,10 +3,14 @@ from datetime import datetime
 from django.db import models
 from django.db.models import Q
 from django.db.models import ObjectDoesNotExist
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.exceptions import ValidationError
 
-from core.db.base import BaseModelMixin
+from core.db.base import BaseModelMixin, BaseQuerySet
+
+
+class UsersManager(UserManager.from_queryset(BaseQuerySet)):
+    """ AbstractUser 的 UserManager 优先于 BaseModelMixin.objects(MRO), 合并 BaseQuerySet 的批量更新 """
 
 
 class UsersModel(AbstractUser, BaseModelMixin):
@@ -30,6 +34,8 @@ class UsersModel(AbstractUser, BaseModelMixin):
     position = models.CharField(max_length=500, verbose_name='职位', default="")
     source = models.CharField(max_length=20, verbose_name="用户来源", default="SYS")
 
+    objects = UsersManager()
+
     class Meta:
         db_table = "users"
         ordering = ['-id']
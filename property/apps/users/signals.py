@@ -0,0 +1,28 @@
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+
+from core.db.signals import post_bulk_update
+from middleware.authorize import auth_token_cache
+
+UserModel = get_user_model()
+
+
+@receiver(post_save, sender=UserModel)
+def on_user_saved(sender, instance, **kwargs):
+    """ 修改密码(set_password 之后 save)、禁用或软删除用户时, 使该用户已缓存的认证 Cookie 失效 """
+    if getattr(instance, '_password', None) is not None or not instance.is_active or instance.is_del:
+        auth_token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=UserModel)
+def on_user_deleted(sender, instance, **kwargs):
+    auth_token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_bulk_update, sender=UserModel)
+def on_users_bulk_updated(sender, pks, changes, **kwargs):
+    """ UserModel.objects.bulk_update_attrs/soft_delete 批量禁用或软删除用户 """
+    if changes.get('is_active') is False or changes.get('is_del'):
+        for pk in pks:
+            auth_token_cache.invalidate_user(pk)
@@ -16,8 +16,7 @@ from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 from . import forms, serializers
-from utils.crypto import AESCipher
-from middleware.authorize import Authentication
+from middleware.authorize import Authentication, auth_token_cache, get_cipher
 
 UserModel = get_user_model()
 logger = logging.getLogger('django')
@@ -35,6 +34,9 @@ class IndexView(TemplateView):
 class LogoutView(View):
     def get(self, request):
         """ 登出 """
+        token = request.COOKIES.get(settings.AUTH_COOKIE_KEY)
+        token and auth_token_cache.invalidate(token)
+
         response = HttpResponseRedirect(reverse("login"))
         response.delete_cookie(settings.CSRF_COOKIE_NAME)
         response.delete_cookie(settings.AUTH_COOKIE_KEY)
@@ -56,7 +58,7 @@ class LoginView(TemplateView):
             serializer = TokenObtainPairSerializer()  # token_type: refresh
             token_data = serializer.validate(request.POST)
             token = token_data['access']
-            cipher_token = AESCipher(settings.AUTH_COOKIE_SALT).encrypt(token)
+            cipher_token = get_cipher(settings.AUTH_COOKIE_SALT).encrypt(token)
 
             response = HttpResponseRedirect(reverse("index"))
             response.set_cookie(
@@ -28,6 +28,29 @@ settings.py:
     fosun_circle.contrib.db_pool,  # Could be a independent package that not under `apps` package
     ......
     ]
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            ......
+            # optional, keys must be capitalised, see ConnectionPool.pool_default_params
+            'POOL_OPTIONS': {
+                'POOL_SIZE': 10,
+                'MAX_OVERFLOW': 15,
+                'RECYCLE': 60 * 60,
+                'PRE_PING': True,
+                'RESET_ON_RETURN': 'rollback',
+            },
+        },
+    }
+
+Pool Stats:
+    from contrib.db_pool.core import conn_pool
+    conn_pool.stats()   # {alias: {pool_size, checked_in, checked_out, overflow, checkouts, wait_total, ...}}
+
+    Prometheus text format of this worker process:
+        GET /db_pool/metrics                        (login required)
+        python manage.py db_pool_metrics [--format json]
 """
 
 import os
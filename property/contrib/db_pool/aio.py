@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio-aware access to the pools of contrib.db_pool (ASGI deployments)
+
+Django's async ORM methods (`aget`, `acount`, ...) run every query through `sync_to_async(thread_sensitive=True)`,
+namely one shared thread per process. Here coroutines await an `asyncio.Semaphore` sized to the capacity of the
+alias's pool (pool_size + max_overflow), so waiting never blocks the event loop nor holds a thread, and the ORM work
+runs in a thread pool of the same size, whose connections are checked out from (and returned to) the same
+QueuePool used by the sync code path. So sync views, async views and ORM calls share one set of pool limits.
+
+Usage:
+    from contrib.db_pool.aio import run_in_pool, pool_to_async
+
+    async def search(request):
+        total = await run_in_pool(queryset.count, using='default')
+        rows = await run_in_pool(lambda: list(queryset[:20]))
+
+    @pool_to_async(using='default')
+    def get_user_list(keyword):
+        return list(UserModel.objects.filter(username__icontains=keyword).values())
+
+    users = await get_user_list('admin')
+"""
+
+import asyncio
+import functools
+import threading
+import contextvars
+from weakref import WeakKeyDictionary
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from .core import conn_pool
+
+__all__ = ('AsyncPool', 'get_async_pool', 'run_in_pool', 'pool_to_async')
+
+
+class AsyncPool(object):
+    """ asyncio gate over the sync pool of one database alias """
+
+    def __init__(self, alias=DEFAULT_DB_ALIAS):
+        self.alias = alias
+        self.capacity = self.get_capacity()
+        self.executor = ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix='db_pool_%s' % alias)
+
+        # asyncio.Semaphore is bound to the running loop
+        self._semaphores = WeakKeyDictionary()
+
+    def get_capacity(self):
+        pool_params = dict(conn_pool.pool_default_params)
+        pool_options = settings.DATABASES[self.alias].get('POOL_OPTIONS', {})
+        pool_params.update({key.lower(): value for key, value in pool_options.items() if key == key.upper()})
+
+        # max_overflow=-1: no limit of overflow in sqlalchemy, so only pool_size is used
+        return pool_params['pool_size'] + max(pool_params['max_overflow'], 0)
+
+    def get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.capacity))
+
+        return semaphore
+
+    @staticmethod
+    def _call(func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # return the connections of this worker thread to their pools
+            connections.close_all()
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+
+        async with self.get_semaphore():
+            call = functools.partial(context.run, self._call, func, *args, **kwargs)
+            return await loop.run_in_executor(self.executor, call)
+
+
+_async_pools = {}
+_async_pools_lock = threading.Lock()
+
+
+def get_async_pool(alias=DEFAULT_DB_ALIAS):
+    async_pool = _async_pools.get(alias)
+
+    if async_pool is None:
+        with _async_pools_lock:
+            if alias not in _async_pools:
+                _async_pools[alias] = AsyncPool(alias)
+
+            async_pool = _async_pools[alias]
+
+    return async_pool
+
+
+async def run_in_pool(func, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """ run sync ORM code in `func` without blocking the event loop, limited by the pool of `using` """
+    return await get_async_pool(using).run(func, *args, **kwargs)
+
+
+def pool_to_async(func=None, *, using=DEFAULT_DB_ALIAS):
+    """ decorator: turn a sync ORM function into a coroutine function, see `run_in_pool` """
+    def decorator(f):
+        @functools.wraps(f)
+        async def wrapper(*args, **kwargs):
+            return await run_in_pool(f, *args, using=using, **kwargs)
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
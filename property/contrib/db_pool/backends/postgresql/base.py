@@ -4,10 +4,10 @@ import logging
 from functools import partial
 
 from django.conf import settings
-from django.db.backends.postgresql import base
+from django.utils.functional import cached_property
 
 from sqlalchemy import event
-from sqlalchemy.pool import manage, QueuePool
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
 from psycopg2 import InterfaceError, ProgrammingError, OperationalError
 
@@ -63,16 +63,6 @@ def is_disconnect(e, connection, cursor):
         return False
 
 
-class DeprecatedDatabaseWrapper(PoolDatabaseWrapperMixin, base.DatabaseWrapper):
-    """
-    Reference: https://github.com/altairbow/django-db-connection-pool
-    Issues: 查询没有问题, insert + update 不起作用
-    """
-
-    class SQLAlchemyDialect(PGDialect_psycopg2):
-        pass
-
-
 class DatabaseCreation(Psycopg2DatabaseCreation):
     def destroy_test_db(self, *args, **kw):
         """Ensure connection pool is disposed before trying to drop database."""
@@ -80,72 +70,53 @@ class DatabaseCreation(Psycopg2DatabaseCreation):
         super(DatabaseCreation, self).destroy_test_db(*args, **kw)
 
 
-class DatabaseWrapper(Psycopg2DatabaseWrapper):
-    """ SQLAlchemy FTW.
-    Reference: https://github.com/heroku-python/django-postgrespool
+class DatabaseWrapper(PoolDatabaseWrapperMixin, Psycopg2DatabaseWrapper):
     """
+    Reference: https://github.com/altairbow/django-db-connection-pool
 
-    POOL_SETTINGS = {
-        'pre_ping': True,
-        'echo': True,
-        'timeout': None,
-        'recycle': 60 * 60,
-        'pool_size': 10,
-        'max_overflow': 15,
-    }
-
-    def __init__(self, *args, **kwargs):
-        super(DatabaseWrapper, self).__init__(*args, **kwargs)
-        self.creation = DatabaseCreation(self)
-
-    @property
-    def db_pool(self):
-        pool_setting = {}
-        pool_options = self.settings_dict.get('POOL_OPTIONS', {})
-
-        for key, value in self.POOL_SETTINGS.items():
-            if key.upper() in pool_options:
-                pool_setting.setdefault(key.lower(), pool_options[key.upper()])
+    Django's psycopg2 backend sets `connection.autocommit = ...` and reads `connection.info`
+    (pg_version, ensure_timezone), both of which would hit the pool's proxy instead of the
+    psycopg2 connection: the autocommit flag never reached the server and inserts/updates were
+    rolled back on checkin, and `_ConnectionFairy.info` is SQLAlchemy's own dict.
+    """
+    creation_class = DatabaseCreation
+
+    class SQLAlchemyDialect(PGDialect_psycopg2):
+        def do_ping(self, dbapi_connection):
+            autocommit = dbapi_connection.autocommit
+
+            try:
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except (InterfaceError, ProgrammingError, OperationalError) as e:
+                if is_disconnect(e, dbapi_connection, None):
+                    return False
+                raise
             else:
-                pool_setting.setdefault(key.lower(), value)
-
-        if hasattr(self, "_db_pool"):
-            pool = getattr(self, "_db_pool")
-        else:
-            pool = manage(Database, **pool_setting)
-            setattr(self, "_db_pool", pool)
-
-        log.info("contrib.db_pool.backends.postgresql.base.DatabaseWrapper <db_pool>: %s", pool)
-        return pool
-
-    def _commit(self):
-        log.info("DatabaseWrapper._commit -> connection: %s, is_usable: %s", self.connection, self.is_usable)
-
-        if self.connection is not None and self.is_usable():
-            with self.wrap_database_errors:
-                return self.connection.commit()
-
-    def _rollback(self):
-        if self.connection is not None and self.is_usable():
-            with self.wrap_database_errors:
-                return self.connection.rollback()
-
-    def _dispose(self):
-        """Dispose of the pool for this instance, closing all connections."""
-        self.close()
-        # _DBProxy.dispose doesn't actually call dispose on the pool
-        conn_params = self.get_connection_params()
-        key = self.db_pool._serialize(**conn_params)
-        try:
-            pool = self.db_pool.pools[key]
-        except KeyError:
-            log.info("DatabaseWrapper._dispose err")
-        else:
-            pool.dispose()
-            del self.db_pool.pools[key]
-
-    def is_usable(self):
-        # https://github.com/kennethreitz/django-postgrespool/issues/24
-        return not self.connection.closed
+                dbapi_connection.autocommit = autocommit
+
+            return True
+
+    @cached_property
+    def pg_version(self):
+        with self.temporary_connection():
+            return self.dbapi_connection.info.server_version
 
+    def _set_autocommit(self, autocommit):
+        with self.wrap_database_errors:
+            self.dbapi_connection.autocommit = autocommit
 
+    def ensure_timezone(self):
+        if self.connection is None:
+            return False
+
+        conn_timezone_name = self.dbapi_connection.info.parameter_status('TimeZone')
+        timezone_name = self.timezone_name
+
+        if timezone_name and conn_timezone_name != timezone_name:
+            with self.connection.cursor() as cursor:
+                cursor.execute(self.ops.set_time_zone_sql(), [timezone_name])
+            return True
+
+        return False
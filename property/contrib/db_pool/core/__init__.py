@@ -7,6 +7,7 @@ except ImportError:
     from django.utils.translation import gettext_lazy as _
 
 from ..core.exceptions import PoolDoesNotExist
+from ..core.metrics import PoolMetrics, render_prometheus
 
 
 class ConnectionPool(dict):
@@ -18,6 +19,7 @@ class ConnectionPool(dict):
         'recycle': 60 * 60,
         'pool_size': 10,
         'max_overflow': 15,
+        'reset_on_return': 'rollback',
     }
 
     def __new__(cls, *args, **kwargs):
@@ -27,6 +29,7 @@ class ConnectionPool(dict):
             # Important:
             # acquire this lock before modify pool_container
             cls._instance.lock = threading.Lock()
+            cls._instance.pool_stats = {}
 
         return cls._instance
 
@@ -39,6 +42,30 @@ class ConnectionPool(dict):
         except KeyError:
             raise PoolDoesNotExist(_('No such pool: {pool_name}').format(pool_name=pool_name))
 
+    def get_stats(self, pool_name):
+        if pool_name not in self.pool_stats:
+            with self.lock:
+                self.pool_stats.setdefault(pool_name, PoolMetrics())
+
+        return self.pool_stats[pool_name]
+
+    def dispose(self, pool_name):
+        """ close all connections of the pool, it will be created again on next connection """
+        with self.lock:
+            alias_pool = self.pop(pool_name, None)
+
+        if alias_pool is not None:
+            alias_pool.dispose()
+
+    def stats(self, pool_name=None):
+        """ {alias: {pool_size, checked_in, checked_out, overflow, waiting, checkouts, created, wait_*, ...}} """
+        pool_names = [pool_name] if pool_name else list(self.keys())
+        return {name: self.get_stats(name).as_dict() for name in pool_names}
+
+    def render_metrics(self):
+        """ prometheus text exposition format """
+        return render_prometheus(dict(self.pool_stats))
+
 
 # the pool's container, for maintaining the pools
 conn_pool = ConnectionPool()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+
+class Histogram(object):
+    """ fixed buckets histogram, compatible with prometheus `histogram` type """
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # the last one is `+Inf`
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """ [(le, cumulative_count), ...] """
+        total, result = 0, []
+
+        for le, count in zip(self.buckets + (float('inf'), ), self.counts):
+            total += count
+            result.append((le, total))
+
+        return result
+
+
+class PoolMetrics(object):
+    """ always-on counters and histograms of one pool(alias) """
+    COUNTERS = ('checkouts', 'checkins', 'created', 'closed', 'recycled', 'invalidated', 'timeouts')
+
+    def __init__(self, buckets=Histogram.DEFAULT_BUCKETS):
+        self.lock = threading.Lock()
+        self.checkout_latency = Histogram(buckets)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.waiting = 0            # threads waiting for a connection now
+        self.waiting_max = 0
+        self.overflow_max = 0
+
+        self._pool = None
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def begin_wait(self):
+        with self.lock:
+            self.waiting += 1
+            self.waiting_max = max(self.waiting_max, self.waiting)
+
+    def end_wait(self, wait, timeout=False):
+        with self.lock:
+            self.waiting -= 1
+
+            if timeout:
+                self.counters['timeouts'] += 1
+            else:
+                self.checkout_latency.observe(wait)
+
+    def attach(self, alias_pool):
+        """ listen the events of `alias_pool` (a sqlalchemy.pool.Pool instance) """
+        self._pool = alias_pool
+        recycle = getattr(alias_pool, '_recycle', -1)
+
+        def on_connect(dbapi_connection, connection_record):
+            self.incr('created')
+
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            overflow = alias_pool.overflow()
+
+            with self.lock:
+                self.counters['checkouts'] += 1
+                self.overflow_max = max(self.overflow_max, overflow)
+
+        def on_checkin(dbapi_connection, connection_record):
+            self.incr('checkins')
+
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            self.incr('invalidated')
+
+        def on_close(dbapi_connection, connection_record):
+            starttime = getattr(connection_record, 'starttime', None)
+            is_recycled = recycle > -1 and starttime is not None and time.time() - starttime > recycle
+
+            with self.lock:
+                self.counters['closed'] += 1
+
+                if is_recycled:
+                    self.counters['recycled'] += 1
+
+        event.listen(alias_pool, 'connect', on_connect)
+        event.listen(alias_pool, 'checkout', on_checkout)
+        event.listen(alias_pool, 'checkin', on_checkin)
+        event.listen(alias_pool, 'invalidate', on_invalidate)
+        event.listen(alias_pool, 'soft_invalidate', on_invalidate)
+        event.listen(alias_pool, 'close', on_close)
+
+    def gauges(self):
+        alias_pool = self._pool
+
+        if alias_pool is None:
+            return dict(waiting=self.waiting)
+
+        return dict(
+            pool_size=alias_pool.size(),
+            checked_in=alias_pool.checkedin(),
+            checked_out=alias_pool.checkedout(),
+            overflow=alias_pool.overflow(),
+            waiting=self.waiting,
+        )
+
+    def as_dict(self):
+        latency = self.checkout_latency
+
+        with self.lock:
+            return dict(
+                self.gauges(),
+                waiting_max=self.waiting_max,
+                overflow_max=self.overflow_max,
+                wait_total=latency.sum,
+                wait_max=latency.max,
+                wait_avg=latency.count and latency.sum / latency.count,
+                **self.counters
+            )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(metrics_map, prefix='db_pool'):
+    """
+    render metrics in prometheus text exposition format(version 0.0.4)
+    :param metrics_map: {alias: PoolMetrics}
+    """
+    lines = []
+    items = sorted(metrics_map.items())
+
+    def write(name, metric_type, help_text, samples):
+        lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+        lines.append('# TYPE %s_%s %s' % (prefix, name, metric_type))
+
+        for suffix, labels, value in samples:
+            label_text = ','.join('%s="%s"' % (k, v) for k, v in labels)
+            lines.append('%s_%s%s{%s} %s' % (prefix, name, suffix, label_text, _format_value(value)))
+
+    snapshots = [(alias, metrics.as_dict()) for alias, metrics in items]
+
+    for name, help_text in [
+        ('pool_size', 'Configured size of the pool.'),
+        ('checked_in', 'Idle connections in the pool.'),
+        ('checked_out', 'Connections checked out of the pool.'),
+        ('overflow', 'Overflow connections in use.'),
+        ('waiting', 'Threads waiting for a connection.'),
+        ('waiting_max', 'Max threads ever waiting for a connection.'),
+        ('overflow_max', 'Max overflow connections ever used.'),
+    ]:
+        samples = [('', [('alias', alias)], snapshot[name]) for alias, snapshot in snapshots if name in snapshot]
+        write(name, 'gauge', help_text, samples)
+
+    for name, help_text in [
+        ('checkouts', 'Connections checked out.'),
+        ('checkins', 'Connections returned to the pool.'),
+        ('created', 'DB-API connections created.'),
+        ('closed', 'DB-API connections closed.'),
+        ('recycled', 'DB-API connections closed by recycle.'),
+        ('invalidated', 'Connections invalidated.'),
+        ('timeouts', 'Checkouts failed by pool timeout.'),
+    ]:
+        samples = [('', [('alias', alias)], snapshot[name]) for alias, snapshot in snapshots]
+        write('connections_%s_total' % name, 'counter', help_text, samples)
+
+    samples = []
+    for alias, metrics in items:
+        with metrics.lock:
+            latency = metrics.checkout_latency
+            samples.extend(
+                ('_bucket', [('alias', alias), ('le', _format_value(le))], count)
+                for le, count in latency.cumulative()
+            )
+            samples.append(('_sum', [('alias', alias)], latency.sum))
+            samples.append(('_count', [('alias', alias)], latency.count))
+    write('checkout_seconds', 'histogram', 'Time spent waiting for a connection.', samples)
+
+    return '\n'.join(lines) + '\n'
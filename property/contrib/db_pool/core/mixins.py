@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import time
 from copy import deepcopy
+from sqlalchemy import exc
 from sqlalchemy import pool
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
@@ -80,17 +82,44 @@ class PoolDatabaseWrapperMixin(object):
 
                 logger.info(_("%s's pool has been created, parameter: %s"), self.alias, pool_params)
 
+                # always-on metrics of self.alias's pool
+                conn_pool.get_stats(self.alias).attach(alias_pool)
+
                 # pool has been created
                 # put into conn_pool for reusing
                 conn_pool.put(self.alias, alias_pool)
 
         # get self.alias's pool from conn_pool
         db_pool = conn_pool.get(self.alias)
-        # get one connection from the pool
-        conn = db_pool.connect()
+        # get one connection from the pool, and record how long it waited for
+        metrics = conn_pool.get_stats(self.alias)
+        metrics.begin_wait()
+        start = time.perf_counter()
+
+        try:
+            conn = db_pool.connect()
+        except Exception as e:
+            metrics.end_wait(time.perf_counter() - start, timeout=isinstance(e, exc.TimeoutError))
+            raise
+
+        metrics.end_wait(time.perf_counter() - start)
         # logger.info(_("got %s's connection from its pool"), self.alias)
         return conn
 
+    @property
+    def dbapi_connection(self):
+        """
+        the connection got from the pool is a proxy(sqlalchemy.pool._ConnectionFairy),
+        reading attributes is delegated to the DB-API connection, but setting is not,
+        so attributes must be set on the DB-API connection
+        """
+        return getattr(self.connection, 'dbapi_connection', self.connection)
+
     def close(self, *args, **kwargs):
         # logger.info(_("release %s's connection to its pool"), self.alias)
         return super(PoolDatabaseWrapperMixin, self).close(*args, **kwargs)
+
+    def _dispose(self):
+        """ dispose of the pool of self.alias, closing all connections """
+        self.close()
+        conn_pool.dispose(self.alias)
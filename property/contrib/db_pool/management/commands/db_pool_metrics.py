@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from contrib.db_pool.core import conn_pool
+
+
+class Command(BaseCommand):
+    help = 'Print the metrics of contrib.db_pool pools in this process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['prometheus', 'json'], default='prometheus')
+        parser.add_argument('--alias', default=None, help='only the pool of this database alias(json format)')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(conn_pool.stats(options['alias']), indent=2))
+        else:
+            self.stdout.write(conn_pool.render_metrics())
@@ -0,0 +1,8 @@
+from django.urls import re_path
+
+from . import views
+
+
+urlpatterns = [
+    re_path("^db_pool/metrics$", view=views.pool_metrics, name="db_pool_metrics"),
+]
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .core import conn_pool
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def pool_metrics(request):
+    """ metrics of the pools in this worker process, prometheus text exposition format """
+    if not request.user.is_authenticated:
+        return HttpResponseForbidden()
+
+    return HttpResponse(conn_pool.render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scatter-gather queries across sharded tables(see core.db.base.ShardingModel and core.db.sharding rules)
+
+    from contrib.db_sharding import ShardQuerySet
+
+    shards = ShardQuerySet.for_model(UserLogModel).filter(is_del=False)
+    total, rows = shards.order_by('-id').paginate(page=2, page_size=20)
+    stats = shards.aggregate(count=Count('id'), last_time=Max('create_time'))
+
+settings.py:
+    DB_SHARDING_WORKERS = 8     # size of the shared thread pool
+"""
+
+from .executor import ShardQuerySet
+
+__all__ = ('ShardQuerySet', )
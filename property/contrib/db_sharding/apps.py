@@ -2,4 +2,4 @@ from django.apps import AppConfig
 
 
 class DbShardingConfig(AppConfig):
-    name = 'db_sharding'
+    name = 'contrib.db_sharding'
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import threading
+from itertools import islice
+from functools import total_ordering
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Avg, Count, Max, Min, Sum
+
+__all__ = ('ShardQuerySet', 'get_executor')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """ 进程内共享的线程池, 大小: settings.DB_SHARDING_WORKERS(默认 8) """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = getattr(settings, 'DB_SHARDING_WORKERS', 8)
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db_sharding')
+
+    return _executor
+
+
+def _call(func, queryset):
+    try:
+        return func(queryset)
+    finally:
+        # 工作线程的数据库连接
+        connections.close_all()
+
+
+@total_ordering
+class _Descending(object):
+    """ 倒序字段的排序键 """
+    __slots__ = ('value', )
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class ShardQuerySet(object):
+    """
+    Scatter-gather: 同一个查询并发地在多个分表(queryset)上执行, 再合并结果
+
+        shards = ShardQuerySet.for_model(UserLogModel).filter(user_id=1).order_by('-create_time', '-id')
+        total, rows = shards.count(), shards[20:40]
+        shards.aggregate(total=Sum('amount'), last=Max('create_time'), avg=Avg('amount'))
+
+    ORDER BY + LIMIT: 每个分表只取前 offset+limit 行(已按相同顺序排序), 用堆多路归并;
+        各分表统一按 NULLS LAST 排序(各数据库默认的 NULL 顺序不同), 与归并的排序键一致;
+        归并在 Python 中比较值, 文本字段按码点排序, 与数据库的排序规则(如 MySQL utf8mb4_general_ci 不区分大小写、
+        PostgreSQL 的 locale collation)不一致时归并结果顺序错误, 文本排序字段需使用二进制排序规则(utf8mb4_bin / "C")
+    聚合: Count/Sum 相加, Min/Max 取最值, Avg 改写成 Sum 与 Count 后合并(保留 filter); distinct=True 无法合并, 不支持
+    """
+    COMBINERS = {
+        Count: sum,
+        Sum: sum,
+        Min: min,
+        Max: max,
+    }
+
+    def __init__(self, querysets, ordering=()):
+        self.querysets = list(querysets)
+        self.ordering = tuple(ordering)
+
+    @classmethod
+    def for_model(cls, model, keys=None, **kwargs):
+        """ model 为 BaseModelMixin 子类, 参数同 BaseModelMixin.get_shards """
+        return cls(model.get_shard_querysets(keys, **kwargs))
+
+    def _clone(self, querysets=None, ordering=None):
+        return self.__class__(
+            self.querysets if querysets is None else querysets,
+            self.ordering if ordering is None else ordering,
+        )
+
+    def _chain(self, method, *args, **kwargs):
+        return self._clone([getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets])
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def values(self, *fields, **expressions):
+        """ 使用 order_by 时, fields 需要包含排序字段 """
+        return self._chain('values', *fields, **expressions)
+
+    def only(self, *fields):
+        return self._chain('only', *fields)
+
+    def order_by(self, *field_names):
+        return self._clone(ordering=field_names)
+
+    def map(self, func):
+        """ 并发执行 func(queryset), 按分表顺序返回结果 """
+        if len(self.querysets) <= 1:
+            return [func(queryset) for queryset in self.querysets]
+
+        executor = get_executor()
+        futures = [executor.submit(_call, func, queryset) for queryset in self.querysets]
+
+        return [future.result() for future in futures]
+
+    def count(self):
+        return sum(self.map(lambda queryset: queryset.count()))
+
+    def exists(self):
+        return any(self.map(lambda queryset: queryset.exists()))
+
+    def aggregate(self, **aggregates):
+        shard_aggregates = {}
+
+        for name, aggregate in aggregates.items():
+            if getattr(aggregate, 'distinct', False):
+                raise TypeError('ShardQuerySet.aggregate does not support %s(distinct=True) across shards'
+                                % aggregate.__class__.__name__)
+            elif isinstance(aggregate, Avg):
+                expression = aggregate.get_source_expressions()[0]
+                shard_aggregates['%s__sum' % name] = Sum(expression, filter=aggregate.filter)
+                shard_aggregates['%s__count' % name] = Count(expression, filter=aggregate.filter)
+            elif type(aggregate) in self.COMBINERS:
+                shard_aggregates[name] = aggregate
+            else:
+                raise TypeError('ShardQuerySet.aggregate does not support %s' % aggregate.__class__.__name__)
+
+        shard_results = self.map(lambda queryset: queryset.aggregate(**shard_aggregates))
+        result = {}
+
+        for name, aggregate in aggregates.items():
+            if isinstance(aggregate, Avg):
+                total = sum(r['%s__sum' % name] or 0 for r in shard_results)
+                count = sum(r['%s__count' % name] or 0 for r in shard_results)
+                result[name] = total / count if count else None
+            else:
+                values = [r[name] for r in shard_results if r[name] is not None]
+                result[name] = self.COMBINERS[type(aggregate)](values) if values else None
+
+        return result
+
+    def get_order_by(self):
+        """ NULL 排在最后, 与 get_sort_key 一致 """
+        return [
+            F(name[1:]).desc(nulls_last=True) if name.startswith('-') else F(name).asc(nulls_last=True)
+            for name in self.ordering
+        ]
+
+    def get_sort_key(self):
+        """ 与 get_order_by 一致的 Python 排序键, 文本按码点比较(见类注释的排序规则说明) """
+        fields = [(name[1:], True) if name.startswith('-') else (name, False) for name in self.ordering]
+
+        def sort_key(row):
+            key = []
+
+            for name, descending in fields:
+                value = row[name] if isinstance(row, dict) else getattr(row, name)
+                key.append((1, ) if value is None else (0, _Descending(value) if descending else value))
+
+            return key
+
+        return sort_key
+
+    def fetch(self, offset=0, limit=None):
+        """ 合并后的 [offset: offset + limit] 行 """
+        stop = None if limit is None else offset + limit
+
+        if self.ordering:
+            order_by = self.get_order_by()
+            querysets = [queryset.order_by(*order_by) for queryset in self.querysets]
+        else:
+            querysets = self.querysets
+
+        shard_rows = self._clone(querysets).map(lambda queryset: list(queryset[:stop] if stop is not None else queryset))
+
+        if self.ordering:
+            rows = heapq.merge(*shard_rows, key=self.get_sort_key())
+        else:
+            rows = (row for rows in shard_rows for row in rows)
+
+        return list(islice(rows, offset, stop))
+
+    def paginate(self, page=1, page_size=20):
+        """ :return: (总行数, 当前页的行) """
+        offset = (max(page, 1) - 1) * page_size
+        return self.count(), self.fetch(offset, page_size)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None or (k.start or 0) < 0 or (k.stop is not None and k.stop < 0):
+                raise ValueError('ShardQuerySet only supports non-negative slicing without step')
+
+            offset = k.start or 0
+            return self.fetch(offset, None if k.stop is None else max(k.stop - offset, 0))
+
+        rows = self.fetch(k, 1)
+
+        if not rows:
+            raise IndexError('ShardQuerySet index out of range')
+
+        return rows[0]
+
+    def __iter__(self):
+        return iter(self.fetch())
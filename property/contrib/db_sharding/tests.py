@@ -1,3 +1,99 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from django.db.models import Q, Avg, Count, Max, Min, Sum
+from django.db.models.expressions import OrderBy
 
-# Create your tests here.
+from .executor import ShardQuerySet
+
+
+class FakeQuerySet(object):
+    """ 分表 queryset 的替身: rows 已按数据库的排序返回, aggregates 为 aggregate() 的结果 """
+
+    def __init__(self, rows=(), aggregates=None):
+        self.rows = list(rows)
+        self.aggregates = aggregates or {}
+        self.order_by_args = None
+        self.aggregate_kwargs = None
+
+    def order_by(self, *args):
+        self.order_by_args = args
+        return self
+
+    def __getitem__(self, k):
+        return self.rows[k]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def count(self):
+        return len(self.rows)
+
+    def aggregate(self, **kwargs):
+        self.aggregate_kwargs = kwargs
+        return {name: self.aggregates.get(name) for name in kwargs}
+
+
+class ShardQuerySetFetchTests(SimpleTestCase):
+    def setUp(self):
+        self.shards = [
+            FakeQuerySet([dict(id=1, score=9), dict(id=4, score=5), dict(id=6, score=None)]),
+            FakeQuerySet([dict(id=2, score=9), dict(id=3, score=7), dict(id=5, score=None)]),
+        ]
+
+    def test_merge_keeps_ordering(self):
+        rows = ShardQuerySet(self.shards).order_by('-score', 'id').fetch()
+        self.assertEqual([row['id'] for row in rows], [1, 2, 3, 4, 5, 6])
+
+    def test_slice_after_merge(self):
+        queryset = ShardQuerySet(self.shards).order_by('-score', 'id')
+        self.assertEqual([row['id'] for row in queryset[1:4]], [2, 3, 4])
+        self.assertEqual(queryset[4]['id'], 5)
+
+        with self.assertRaises(IndexError):
+            queryset[6]
+
+    def test_order_by_nulls_last(self):
+        ShardQuerySet(self.shards).order_by('-score', 'id').fetch()
+
+        for shard in self.shards:
+            self.assertEqual(len(shard.order_by_args), 2)
+
+            for expression, descending in zip(shard.order_by_args, (True, False)):
+                self.assertIsInstance(expression, OrderBy)
+                self.assertEqual(expression.descending, descending)
+                self.assertTrue(expression.nulls_last)
+
+    def test_count(self):
+        self.assertEqual(ShardQuerySet(self.shards).count(), 6)
+
+
+class ShardQuerySetAggregateTests(SimpleTestCase):
+    def test_combine(self):
+        shards = [
+            FakeQuerySet(aggregates=dict(total=3, amount=10, low=2, high=8, avg__sum=10, avg__count=3)),
+            FakeQuerySet(aggregates=dict(total=1, amount=None, low=None, high=None, avg__sum=None, avg__count=0)),
+            FakeQuerySet(aggregates=dict(total=2, amount=5, low=1, high=4, avg__sum=5, avg__count=2)),
+        ]
+        result = ShardQuerySet(shards).aggregate(
+            total=Count('id'), amount=Sum('amount'), low=Min('amount'), high=Max('amount'), avg=Avg('amount'),
+        )
+
+        self.assertEqual(result, dict(total=6, amount=15, low=1, high=8, avg=3))
+
+    def test_empty(self):
+        shards = [FakeQuerySet(aggregates=dict(avg__count=0)), FakeQuerySet(aggregates=dict(avg__count=0))]
+        self.assertEqual(ShardQuerySet(shards).aggregate(high=Max('amount'), avg=Avg('amount')), dict(high=None, avg=None))
+
+    def test_avg_keeps_filter(self):
+        shard = FakeQuerySet(aggregates=dict(avg__sum=6, avg__count=3))
+        condition = Q(is_del=False)
+
+        self.assertEqual(ShardQuerySet([shard]).aggregate(avg=Avg('amount', filter=condition)), dict(avg=2))
+        self.assertEqual(shard.aggregate_kwargs['avg__sum'].filter, condition)
+        self.assertEqual(shard.aggregate_kwargs['avg__count'].filter, condition)
+
+    def test_distinct_unsupported(self):
+        queryset = ShardQuerySet([FakeQuerySet(), FakeQuerySet()])
+
+        for aggregate in (Count('id', distinct=True), Sum('amount', distinct=True), Avg('amount', distinct=True)):
+            with self.assertRaises(TypeError):
+                queryset.aggregate(value=aggregate)
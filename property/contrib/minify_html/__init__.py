@@ -1,3 +1,6 @@
-""" https://github.com/cobrateam/django-htmlmin/tree/master """
+""" https://github.com/cobrateam/django-htmlmin/tree/master
+
+settings.HTML_MIN_PARSER: html5lib(默认) / html.parser / lxml / tokenizer
+"""
 
 __version__ = '0.11.0'
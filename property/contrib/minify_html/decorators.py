@@ -1,6 +1,6 @@
 from functools import wraps
 
-from minify import html_minify
+from .minify import html_minify, is_cacheable
 
 
 def minified_response(f):
@@ -11,7 +11,7 @@ def minified_response(f):
         minifiable_content = 'text/html' in response['Content-Type']
 
         if minifiable_status and minifiable_content:
-            response.content = html_minify(response.content)
+            response.content = html_minify(response.content, cache=is_cacheable(args[0] if args else None, response))
         return response
 
     return minify
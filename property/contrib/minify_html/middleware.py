@@ -3,8 +3,9 @@ import json
 
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import cached_property
 
-from .minify import html_minify
+from .minify import html_minify, check_parser, is_cacheable, HTML_MIN_PARSER
 
 
 class MarkRequestMiddleware(MiddlewareMixin):
@@ -13,24 +14,37 @@ class MarkRequestMiddleware(MiddlewareMixin):
 
 
 class HtmlMinifyMiddleware(MiddlewareMixin):
-    HTML_REGEX = re.compile(r'<template>.*?</template>', re.M | re.S)
+    HTML_REGEX = re.compile(rb'<template>.*?</template>', re.M | re.S)
+    HYBRID_CONTENT_TYPE = 'application/json'
+
+    def __init__(self, get_response):
+        check_parser(HTML_MIN_PARSER)
+        super().__init__(get_response)
+
+    @cached_property
+    def exclude_regexes(self):
+        return [re.compile(url_pattern) for url_pattern in getattr(settings, 'EXCLUDE_FROM_MINIFYING', ())]
 
     def _is_hybrid(self, response):
         """ A hybrid of html and json """
+        # 先检查 Content-Type 与原始 bytes, 普通的 JSON 接口响应不解码、不解析
+        if response.streaming or self.HYBRID_CONTENT_TYPE not in response.get('Content-Type', ''):
+            return False
+
         # Mixed Content maybe have Html to Vue
+        if not self.HTML_REGEX.search(response.content):
+            return False
+
         try:
-            if self.HTML_REGEX.search(response.content.decode()):
-                data = json.loads(response.content)
-                if 'html' in data:
-                    return True
+            data = json.loads(response.content)
         except json.JSONDecodeError:
-            pass
+            return False
 
-        return False
+        return isinstance(data, dict) and 'html' in data
 
-    def _html_minify_hybrid(self, response, ignore_comments=True, parser=None):
+    def _html_minify_hybrid(self, response, ignore_comments=True, parser=None, cache=False):
         data = json.loads(response.content)
-        mini_html = html_minify(data['html'], ignore_comments=ignore_comments, parser=parser)
+        mini_html = html_minify(data['html'], ignore_comments=ignore_comments, parser=parser, cache=cache)
         data['html'] = mini_html
 
         return json.dumps(data)
@@ -41,14 +55,12 @@ class HtmlMinifyMiddleware(MiddlewareMixin):
         except AttributeError:
             return False
 
-        if hasattr(settings, 'EXCLUDE_FROM_MINIFYING'):
-            for url_pattern in settings.EXCLUDE_FROM_MINIFYING:
-                regex = re.compile(url_pattern)
-                if regex.match(request.path.lstrip('/')):
-                    req_ok = False
-                    break
+        path = request.path.lstrip('/')
 
-        resp_ok = 'text/html' in response.get('Content-Type', '')
+        if any(regex.match(path) for regex in self.exclude_regexes):
+            req_ok = False
+
+        resp_ok = not response.streaming and 'text/html' in response.get('Content-Type', '')
         if hasattr(response, 'minify_response'):
             resp_ok = resp_ok and response.minify_response
 
@@ -57,18 +69,22 @@ class HtmlMinifyMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         minify = getattr(settings, "HTML_MINIFY", not settings.DEBUG)
         keep_comments = getattr(settings, 'KEEP_COMMENTS_ON_MINIFYING', False)
-        parser = getattr(settings, 'HTML_MIN_PARSER', 'html5lib')
+        parser = HTML_MIN_PARSER
 
         if minify:
+            cache = is_cacheable(request, response)
+
             if self.can_minify_response(request, response):
-                content = html_minify(response.content, ignore_comments=not keep_comments, parser=parser)
+                content = html_minify(response.content, ignore_comments=not keep_comments, parser=parser, cache=cache)
             elif self._is_hybrid(response):
                 # Issue: 子组件的自组件无法正产展示
-                content = self._html_minify_hybrid(response, ignore_comments=not keep_comments, parser=parser)
+                content = self._html_minify_hybrid(
+                    response, ignore_comments=not keep_comments, parser=parser, cache=cache
+                )
             else:
-                content = response.content
+                return response
 
             response.content = content
-            response['Content-Length'] = len(content)
+            response['Content-Length'] = len(response.content)
 
         return response
@@ -1,8 +1,13 @@
 import re
+import hashlib
+import threading
+from collections import OrderedDict
+
 import six
 import bs4
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 from .util import force_text
 
@@ -24,6 +29,13 @@ TEXT_FLOW = {
 # fold the doctype element, if True then no newline is added after the
 # doctype element. If False, a newline will be inserted
 FOLD_DOCTYPE = True
+
+# html5lib / html.parser: BeautifulSoup; lxml: lxml 元素树; tokenizer: html.parser 流式输出(不重建文档)
+HTML_MIN_PARSER = getattr(settings, "HTML_MIN_PARSER", "html5lib")
+# 可缓存(见 is_cacheable)的页面按内容哈希缓存压缩结果(进程内 LRU), 超过 HTML_MIN_CACHE_MAX_LENGTH 个字符的内容不缓存
+HTML_MIN_CACHE_SIZE = getattr(settings, "HTML_MIN_CACHE_SIZE", 128)
+HTML_MIN_CACHE_MAX_LENGTH = getattr(settings, "HTML_MIN_CACHE_MAX_LENGTH", 64 * 1024)
+
 re_space = six.u('((?=\\s)[^\xa0])')
 re_multi_space = re.compile(re_space + '+', re.MULTILINE | re.UNICODE)
 re_single_nl = re.compile(r'^\n$', re.MULTILINE | re.UNICODE)
@@ -39,14 +51,107 @@ re_cond_comment_end_space = re.compile(r'\s+(<!\[endif\])',
                                        re.MULTILINE | re.DOTALL | re.UNICODE)
 
 
-def html_minify(html_code, ignore_comments=True, parser="html5lib"):
-    html_code = force_text(html_code)
+class MinifiedCache(object):
+    """ 压缩结果的 LRU 缓存, 键为 (parser, ignore_comments, 内容的 blake2b 摘要) """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(html_code, ignore_comments, parser):
+        digest = hashlib.blake2b(html_code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return parser, bool(ignore_comments), digest
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+minified_cache = MinifiedCache(maxsize=HTML_MIN_CACHE_SIZE)
+
+
+def soup_minify(html_code, ignore_comments=True, parser="html5lib"):
     soup = bs4.BeautifulSoup(html_code, parser)
     mini_soup = space_minify(soup, ignore_comments)
-    if FOLD_DOCTYPE is True:
-        # monkey patching to remove new line after doctype
-        bs4.element.Doctype.SUFFIX = six.u('>')
-    return six.text_type(mini_soup)
+    result = six.text_type(mini_soup)
+
+    # remove new line after doctype (Doctype.SUFFIX), 不修改 bs4 的全局属性
+    if FOLD_DOCTYPE is True and mini_soup.contents and isinstance(mini_soup.contents[0], bs4.element.Doctype):
+        doctype_end = result.find(bs4.element.Doctype.SUFFIX)
+        result = result[:doctype_end] + '>' + result[doctype_end + len(bs4.element.Doctype.SUFFIX):]
+
+    return result
+
+
+def check_parser(parser):
+    """ 校验压缩后端可用, 在 HtmlMinifyMiddleware 初始化时调用, 配置错误在启动时暴露而不是每个响应抛出异常 """
+    if parser == "tokenizer":
+        return
+
+    if parser == "lxml":
+        from .parsers import etree
+
+        if etree is None:
+            raise ImproperlyConfigured("HTML_MIN_PARSER = 'lxml' requires the `lxml` package")
+    elif bs4.builder.builder_registry.lookup(parser) is None:
+        raise ImproperlyConfigured("HTML_MIN_PARSER = %r: BeautifulSoup tree builder is not installed" % parser)
+
+
+def is_cacheable(request, response):
+    """ 只缓存 GET/HEAD 且未禁止缓存(no-store/private)的页面, 避免在内存中保留用户私有内容 """
+    cache_control = response.get("Cache-Control", "")
+    return getattr(request, "method", None) in ("GET", "HEAD") \
+        and "no-store" not in cache_control and "private" not in cache_control
+
+
+def get_minifier(parser):
+    """ :return: func(html_code, ignore_comments) """
+    from .parsers import LxmlMinifier, TokenizerMinifier
+
+    if parser == "lxml":
+        return lambda html_code, ignore_comments: LxmlMinifier(ignore_comments).minify(html_code)
+    elif parser == "tokenizer":
+        return lambda html_code, ignore_comments: TokenizerMinifier(ignore_comments).minify(html_code)
+
+    return lambda html_code, ignore_comments: soup_minify(html_code, ignore_comments, parser)
+
+
+def html_minify(html_code, ignore_comments=True, parser=None, cache=False):
+    """ cache: 是否使用压缩结果缓存, 只对 is_cacheable 的响应开启 """
+    parser = parser or HTML_MIN_PARSER
+    html_code = force_text(html_code)
+
+    if not html_code or not html_code.strip():
+        return html_code
+
+    cacheable = cache and len(html_code) <= HTML_MIN_CACHE_MAX_LENGTH
+    key = cacheable and minified_cache.make_key(html_code, ignore_comments, parser)
+    result = cacheable and minified_cache.get(key)
+
+    if not result:
+        result = get_minifier(parser)(html_code, ignore_comments)
+        cacheable and minified_cache.set(key, result)
+
+    return result
 
 
 def space_minify(soup, ignore_comments=True):
@@ -0,0 +1,202 @@
+""" 不依赖 BeautifulSoup 的压缩后端: lxml 与基于 html.parser 的流式 tokenizer, 空白规则与 minify.space_minify 一致 """
+from html.parser import HTMLParser
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = etree = None
+
+from .minify import (
+    EXCLUDE_TAGS, CONSERVATIVE_WHITESPACE, TEXT_FLOW, re_multi_space, re_only_space, re_start_space,
+    re_end_space, re_single_nl, re_cond_comment, re_cond_comment_start_space, re_cond_comment_end_space,
+)
+
+__all__ = ('minify_text', 'minify_cond_comment', 'LxmlMinifier', 'TokenizerMinifier')
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+def minify_text(text, prev_flow, next_flow):
+    """ 文本节点的空白压缩, prev_flow/next_flow: 前后的兄弟节点是否为行内文本元素(父元素是时均为 True) """
+    text = re_multi_space.sub(' ', text)
+
+    if not CONSERVATIVE_WHITESPACE:
+        text = re_only_space.sub(' ' if prev_flow and next_flow else '', text)
+        text = re_start_space.sub(' ' if prev_flow else '', text)
+        text = re_end_space.sub(' ' if next_flow else '', text)
+
+    return re_single_nl.sub('', text)
+
+
+def minify_cond_comment(text):
+    text = re_multi_space.sub(' ', text)
+    text = re_cond_comment_start_space.sub(r'\1', text)
+    return re_cond_comment_end_space.sub(r'\1', text)
+
+
+class LxmlMinifier:
+    """ lxml(C 实现)解析, 只遍历一次元素树, 修改 text/tail """
+
+    def __init__(self, ignore_comments=True):
+        if lxml is None:
+            raise ImportError("HTML_MIN_PARSER = 'lxml' requires the `lxml` package")
+
+        self.ignore_comments = ignore_comments
+
+    @staticmethod
+    def is_text_tag(element):
+        return element is not None and element.tag in TEXT_FLOW
+
+    def minify_comment(self, comment):
+        if re_cond_comment.search(comment.text or ''):
+            comment.text = minify_cond_comment(comment.text)
+        elif self.ignore_comments:
+            # 保留 tail
+            comment.drop_tree()
+
+    def minify_element(self, element, parent_excluded):
+        excluded = parent_excluded or (isinstance(element.tag, str) and element.tag in EXCLUDE_TAGS)
+
+        if not excluded and element.text and isinstance(element.tag, str):
+            children = len(element)
+            parent_flow = element.tag in TEXT_FLOW
+            next_flow = parent_flow or (children and self.is_text_tag(element[0]))
+            element.text = minify_text(element.text, parent_flow, next_flow)
+
+        for child in list(element):
+            self.minify_element(child, excluded)
+
+        parent = element.getparent()
+
+        if element.tail and parent is not None and not parent_excluded:
+            parent_flow = parent.tag in TEXT_FLOW
+            prev_flow = parent_flow or self.is_text_tag(element)
+            next_flow = parent_flow or self.is_text_tag(element.getnext())
+            element.tail = minify_text(element.tail, prev_flow, next_flow)
+
+        if element.tag is etree.Comment and not excluded:
+            self.minify_comment(element)
+
+    def minify(self, html_code):
+        root = lxml.html.document_fromstring(html_code)
+        self.minify_element(root, False)
+
+        doctype = root.getroottree().docinfo.doctype
+        result = lxml.html.tostring(root, encoding='unicode', method='html')
+        return doctype + result if doctype else result
+
+
+class TokenizerMinifier(HTMLParser):
+    """ 流式 tokenizer: 标签、实体按原文输出, 不重建文档树, 可多次 feed
+
+        minifier = TokenizerMinifier()
+        minifier.feed(chunk) ...
+        html = minifier.close()
+    """
+
+    def __init__(self, ignore_comments=True):
+        super().__init__(convert_charrefs=False)
+        self.ignore_comments = ignore_comments
+        self._output = []
+        self._text = []
+        self._stack = []
+        self._excluded = 0
+        self._prev_flow = False
+
+    def _flush_text(self, next_flow=False):
+        if not self._text:
+            return
+
+        text, self._text = ''.join(self._text), []
+
+        if self._excluded:
+            self._output.append(text)
+            return
+
+        if self._stack and self._stack[-1] in TEXT_FLOW:
+            prev_flow = next_flow = True
+        else:
+            prev_flow = self._prev_flow
+
+        self._output.append(minify_text(text, prev_flow, next_flow))
+
+    def _start(self, tag, text, closed=False):
+        self._flush_text(next_flow=tag in TEXT_FLOW)
+        self._output.append(text)
+
+        if closed or tag in VOID_TAGS:
+            self._prev_flow = tag in TEXT_FLOW
+            return
+
+        self._stack.append(tag)
+        self._excluded += tag in EXCLUDE_TAGS
+        self._prev_flow = False
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, self.get_starttag_text(), closed=True)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        self._output.append('</%s>' % tag)
+
+        if tag in self._stack:
+            while self._stack:
+                open_tag = self._stack.pop()
+                self._excluded -= open_tag in EXCLUDE_TAGS
+
+                if open_tag == tag:
+                    break
+
+        self._prev_flow = tag in TEXT_FLOW
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_entityref(self, name):
+        self._text.append('&%s;' % name)
+
+    def handle_charref(self, name):
+        self._text.append('&#%s;' % name)
+
+    def handle_comment(self, data):
+        self._flush_text()
+        self._prev_flow = False
+
+        if self._excluded:
+            self._output.append('<!--%s-->' % data)
+        elif re_cond_comment.search(data):
+            self._output.append('<!--%s-->' % minify_cond_comment(data))
+        elif not self.ignore_comments:
+            self._output.append('<!--%s-->' % data)
+
+    def handle_decl(self, decl):
+        self._flush_text()
+        self._output.append('<!%s>' % decl)
+
+    def unknown_decl(self, data):
+        self._flush_text()
+        self._output.append('<![%s]>' % data)
+
+    def handle_pi(self, data):
+        self._flush_text()
+        self._output.append('<?%s>' % data)
+
+    def read(self):
+        """ 已完成的输出 """
+        output, self._output = ''.join(self._output), []
+        return output
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        return self.read()
+
+    def minify(self, html_code):
+        self.feed(html_code)
+        return self.close()
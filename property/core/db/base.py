@@ -1,16 +1,18 @@
+import threading
 from copy import deepcopy
+from operator import attrgetter
 from datetime import date, datetime
 
-from django.db import models
+from django.db import models, DatabaseError
 from django.db.models.base import ModelBase
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.deconstruct import deconstructible
-from django.core.management.utils import get_random_string
 
 from core.globals import local_user
+from core.db.signals import post_bulk_update, is_audited
 
-__all__ = ('BaseModelMixin', )
+__all__ = ('BaseModelMixin', 'BaseQuerySet', 'BaseManager')
 
 
 @deconstructible
@@ -30,6 +32,38 @@ class AutoExecutor:
             return self._default
 
 
+class BaseQuerySet(models.QuerySet):
+    """ 批量更新: 每批一条 UPDATE, 同时更新 modifier/update_time, 并发送 post_bulk_update 信号(auditlog) """
+
+    def bulk_update_attrs(self, batch_size=2000, **attrs):
+        """ :return: 更新的行数 """
+        model = self.model
+        db = self.db
+        attrs.setdefault('modifier', AutoExecutor()())
+        attrs['update_time'] = timezone.now()
+
+        audited = is_audited(model)
+        pks = list(self.values_list('pk', flat=True))
+        row_count = 0
+
+        for i in range(0, len(pks), batch_size):
+            batch_pks = pks[i:i + batch_size]
+            batch_queryset = model._base_manager.using(db).filter(pk__in=batch_pks)
+            old_objects = audited and {obj.pk: obj for obj in batch_queryset} or None
+
+            row_count += batch_queryset.update(**attrs)
+            post_bulk_update.send(sender=model, pks=batch_pks, changes=attrs, old_objects=old_objects, using=db)
+
+        return row_count
+
+    def soft_delete(self, batch_size=2000):
+        return self.bulk_update_attrs(batch_size=batch_size, is_del=True)
+
+
+class BaseManager(models.Manager.from_queryset(BaseQuerySet)):
+    pass
+
+
 class BaseModelMixin(models.Model):
     """ 数据库 Model """
 
@@ -39,10 +73,16 @@ class BaseModelMixin(models.Model):
     update_time = models.DateTimeField(verbose_name='更新时间', auto_now=True)
     is_del = models.BooleanField(verbose_name='是否删除', default=False)
 
+    objects = BaseManager()
+
+    # 分片规则(core.db.sharding.ShardRule), 见 get_shard
+    shard_rule = None
+
     class Meta:
         abstract = True
 
-    def default(self, o):
+    @staticmethod
+    def default(o):
         if isinstance(o, datetime):
             return o.strftime("%Y-%m-%d %H:%M:%S")
 
@@ -52,9 +92,16 @@ class BaseModelMixin(models.Model):
         return o
 
     def save(self, *args, **kwargs):
+        now = timezone.now()
+
         if not self.create_time:
-            self.create_time = timezone.now()
-        self.update_time = timezone.now()
+            self.create_time = now
+        self.update_time = now
+
+        # update_fields=[] 不保存(Django 的约定), 不追加 update_time
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'update_time' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['update_time']
 
         return super(BaseModelMixin, self).save(*args, **kwargs)
 
@@ -63,14 +110,57 @@ class BaseModelMixin(models.Model):
             self.__dict__[attr] = value
 
         if force_update:
-            self.save()
+            if self._state.adding:
+                self.save()
+            else:
+                # 只更新修改的字段
+                concrete_fields = {name for f in self._meta.concrete_fields for name in (f.name, f.attname)}
+                self.modifier = AutoExecutor()()
+
+                try:
+                    self.save(update_fields=[attr for attr in kwargs if attr in concrete_fields] + ['modifier'])
+                except DatabaseError as e:
+                    # "Save with update_fields did not affect any rows.": 行已被(并发)删除,
+                    # 同原来的 save(): UPDATE 不到时重新 INSERT. 数据库的错误是 DatabaseError 的子类, 直接抛出
+                    if type(e) is not DatabaseError:
+                        raise
+
+                    self.save()
 
         return self
 
     def to_dict(self, *extra, exclude=()):
-        fields = list(set(self.fields() + list(extra)) - set(exclude))
+        field_names, _, getter = self.compile_fields()
+
+        if extra or exclude:
+            exclude_fields = set(exclude)
+            field_names = tuple(dict.fromkeys(n for n in field_names + extra if n not in exclude_fields))
+            getter = attrgetter(*field_names) if field_names else None
+
         # model_dict = model_to_dict(self)
-        return {_field: self.default(self.__dict__[_field]) for _field in fields}
+        return _values_to_dict(field_names, getter(self) if getter else (), self.default)
+
+    @classmethod
+    def to_dicts(cls, queryset=None, exclude=()):
+        """ 批量转换: values_list 取数, 不实例化模型 """
+        field_names = tuple(cls.fields(exclude=exclude))
+        queryset = cls.objects.all() if queryset is None else queryset
+        default = cls.default
+
+        return [dict(zip(field_names, map(default, row))) for row in queryset.values_list(*field_names)]
+
+    @classmethod
+    def compile_fields(cls):
+        """ 每个模型只计算一次: (非 BaseAbstractModel 字段的 attname 元组, 集合, attrgetter) """
+        compiled = cls.__dict__.get('_compiled_fields')
+
+        if compiled is None:
+            abc_fields = set(cls.abc_fields())
+            field_names = tuple(f.attname for f in cls._meta.fields if f.attname not in abc_fields)
+            compiled = (field_names, frozenset(field_names), attrgetter(*field_names) if field_names else None)
+            cls._compiled_fields = compiled
+
+        return compiled
 
     @classmethod
     def fields(cls, exclude=()):
@@ -81,20 +171,13 @@ class BaseModelMixin(models.Model):
             3: opts.concrete_fields
             4: opts.private_fields, opts.many_to_many
          """
-        fields = []
-        exclude_fields = set(exclude)
-        abc_fields = cls.abc_fields()
+        field_names = cls.compile_fields()[0]
 
-        for field in cls._meta.fields:
-            field_name = field.attname
+        if not exclude:
+            return list(field_names)
 
-            if field_name in exclude_fields:
-                continue
-
-            if field_name not in abc_fields:
-                fields.append(field_name)
-
-        return fields
+        exclude_fields = set(exclude)
+        return [name for name in field_names if name not in exclude_fields]
 
     @classmethod
     def get_fields(cls, exclude=()):
@@ -103,7 +186,7 @@ class BaseModelMixin(models.Model):
     @classmethod
     def create_object(cls, force_insert=True, **kwargs):
         """ 创建对象 """
-        model_fields = cls.fields()
+        model_fields = cls.compile_fields()[1]
         new_kwargs = {key: value for key, value in kwargs.items() if key in model_fields}
 
         if force_insert:
@@ -115,74 +198,120 @@ class BaseModelMixin(models.Model):
 
     @classmethod
     def abc_fields(cls):
-        return [f.name for f in BaseModelMixin._meta.fields]
+        return ABC_FIELDS
 
     @classmethod
     def get_sharding(cls, sharding_table):
         """ 水平分表(表结构相同)，适用于单表数据量太大切分到不同的表中 """
         return ShardingModel(shard_model_cls=cls).create_sharding_model(sharding_table)
 
+    @classmethod
+    def get_shard(cls, key):
+        """ 按分片键(shard_rule)返回 (分表模型, 数据库别名) """
+        if cls.shard_rule is None:
+            raise ValueError('Model<%s> has no `shard_rule`' % cls.__name__)
+
+        sharding_table, alias = cls.shard_rule(key)
+        return cls.get_sharding(sharding_table), alias
+
+    @classmethod
+    def get_shards(cls, keys=None, **kwargs):
+        """ 多个分片: [(分表模型, 数据库别名), ...], keys 为 None 时返回全部分片(DateShardRule 需要 start/end) """
+        if cls.shard_rule is None:
+            raise ValueError('Model<%s> has no `shard_rule`' % cls.__name__)
+
+        return [
+            (cls.get_sharding(sharding_table), alias)
+            for sharding_table, alias in cls.shard_rule.get_shards(keys, **kwargs)
+        ]
+
+    @staticmethod
+    def _shard_queryset(model_cls, alias=None):
+        manager = model_cls._default_manager
+        return manager.using(alias) if alias else manager.all()
+
+    @classmethod
+    def shard_objects(cls, key):
+        """ 分片键所在分表的 queryset """
+        return cls._shard_queryset(*cls.get_shard(key))
+
+    @classmethod
+    def get_shard_querysets(cls, keys=None, **kwargs):
+        """ 多个分表的 queryset, 参数同 get_shards """
+        return [cls._shard_queryset(model_cls, alias) for model_cls, alias in cls.get_shards(keys, **kwargs)]
+
+
+ABC_FIELDS = tuple(f.name for f in BaseModelMixin._meta.fields)
+
+
+def _values_to_dict(field_names, values, default):
+    """ attrgetter 单个字段时返回值本身, 多个字段时返回元组 """
+    if len(field_names) == 1:
+        values = (values, )
+
+    return {name: default(value) for name, value in zip(field_names, values)}
+
 
 class ShardingModel:
-    """ ShardingModel support table horizontal partition """
+    """ ShardingModel support table horizontal partition
+
+    分表模型注册表: (基础模型, 分表名) -> 分表模型类, 每个分表模型类在进程内只构建一次(线程安全)
+    """
     _shard_db_models = {}
-    _base_shard_model_cls = None
+    _lock = threading.Lock()
 
-    def __new__(cls,  *args, **kwargs):
-        cls._base_shard_model_cls = kwargs.pop("shard_model_cls")
-        return super().__new__(cls, *args, **kwargs)
+    def __init__(self, shard_model_cls):
+        self._base_shard_model_cls = shard_model_cls
 
     def create_sharding_model(self, sharding_table):
-        class Meta:
-            db_table = sharding_table
-            ordering = ["-id"]
+        key = (self._base_shard_model_cls, sharding_table)
+        model_class = self._shard_db_models.get(key)
 
-        class ShardMetaclass(ModelBase):
-            def __new__(cls, name, bases, attrs):
-                shard_model_cls = self._base_shard_model_cls
-                base_model_name = shard_model_cls.__name__
+        if model_class is None:
+            with self._lock:
+                model_class = self._shard_db_models.get(key)
 
-                # 原字段可能存在缓存，导致查询时表名指向错误
-                new_concrete_fields = {}
-                for field in shard_model_cls._meta.concrete_fields:
-                    dp_field = deepcopy(field)
+                if model_class is None:
+                    # 每个分表模型类不同(id(model_class))，互不影响
+                    model_class = self.build_sharding_model(sharding_table)
+                    self._shard_db_models[key] = model_class
 
-                    for name in dir(dp_field.__class__):
-                        val = getattr(dp_field.__class__, name, None)
-                        if isinstance(val, cached_property) and hasattr(dp_field, name):
-                            delattr(dp_field, name)
+        return model_class
 
-                    new_concrete_fields[field.name] = dp_field
+    def build_sharding_model(self, sharding_table):
+        shard_model_cls = self._base_shard_model_cls
+        base_model_name = shard_model_cls.__name__
 
-                attrs.update({
-                    '__module__': shard_model_cls.__module__,
-                    '__doc__': 'Using %s table from %s Model' % (sharding_table, base_model_name),
-                    'Meta': Meta
-                }, **new_concrete_fields)
+        class Meta:
+            db_table = sharding_table
+            ordering = ["-id"]
 
-                model_name = sharding_table.title().replace("_", "") + "_Sharding_%s" % get_random_string(8)
-                model_cls = super().__new__(cls, "%sModel" % model_name, shard_model_cls.__bases__, attrs)
-                # model_meta = model_cls._meta
-                # model_meta.db_table = sharding_table
+        # 原字段可能存在缓存，导致查询时表名指向错误
+        new_concrete_fields = {}
+        for field in shard_model_cls._meta.concrete_fields:
+            dp_field = deepcopy(field)
 
-                return model_cls
+            for name in dir(dp_field.__class__):
+                val = getattr(dp_field.__class__, name, None)
+                if isinstance(val, cached_property) and hasattr(dp_field, name):
+                    delattr(dp_field, name)
 
-        class ProxyShardingModel(metaclass=ShardMetaclass):
-            def __str__(self):
-                model_name = self.__class__.__name__.split("_")[0]
-                return '%s object (%s)' % (model_name, self.pk)
+            new_concrete_fields[field.name] = dp_field
 
-        model_class = self._shard_db_models.get(sharding_table)
-        if model_class is not None:
-            return model_class
+        def __str__(self):
+            model_name = self.__class__.__name__.split("_")[0]
+            return '%s object (%s)' % (model_name, self.pk)
 
-        # 这种方法与原Model类一样，如果同时计算多个分表的数据，最终只有一个有效
-        # model_class = self._base_shard_model_cls._meta.db_table = sharding_table
+        attrs = {
+            '__module__': shard_model_cls.__module__,
+            '__doc__': 'Using %s table from %s Model' % (sharding_table, base_model_name),
+            '__str__': __str__,
+            'Meta': Meta,
+        }
+        attrs.update(new_concrete_fields)
 
-        # 每个id(model_class)不同，互不影响
-        model_class = ProxyShardingModel
-        self._shard_db_models[sharding_table] = model_class
-        return model_class
+        model_name = sharding_table.title().replace("_", "") + "_Sharding_%s" % base_model_name
+        return ModelBase(model_name, shard_model_cls.__bases__, attrs)
 
     @staticmethod
     def get_relation_fields(fields):
@@ -201,4 +330,3 @@ class ShardingModel:
             if f.is_relation and f.many_to_one:
                 pass
         return relation_fields
-
@@ -0,0 +1,206 @@
+import json
+import tempfile
+
+from django.db import DatabaseError, connections, models, transaction
+from django.db.models.constants import OnConflict
+
+__all__ = ('InsertLoader', 'PostgresCopyLoader', 'MySQLLoadDataLoader', 'get_loader')
+
+
+class InsertLoader:
+    """ 通用写入: 多行 INSERT ... VALUES (...), (...), 一次 load 一个事务 """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def connection(self):
+        return connections[self.alias]
+
+    def can_load(self, model, fields, rows):
+        return True
+
+    def get_upsert_sql(self, model, fields):
+        """ 主键冲突时更新其它字段: ON CONFLICT ... DO UPDATE / ON DUPLICATE KEY UPDATE """
+        pk = model._meta.pk
+        update_columns = [f.column for f in fields if f is not pk]
+        on_conflict = OnConflict.UPDATE if update_columns else OnConflict.IGNORE
+
+        return self.connection.ops.on_conflict_suffix_sql(fields, on_conflict, update_columns, [pk.column])
+
+    def insert(self, model, fields, rows, upsert=False):
+        conn = self.connection
+        ops = conn.ops
+
+        table = ops.quote_name(model._meta.db_table)
+        columns = ', '.join(ops.quote_name(f.column) for f in fields)
+        batch_size = max(ops.bulk_batch_size(fields, rows), 1)
+        suffix_sql = self.get_upsert_sql(model, fields) if upsert else ''
+
+        with conn.cursor() as cursor:
+            for i in range(0, len(rows), batch_size):
+                batch_rows = rows[i:i + batch_size]
+                values_sql = ops.bulk_insert_sql(fields, [['%s'] * len(fields)] * len(batch_rows))
+                params = [
+                    f.get_db_prep_save(value, connection=conn)
+                    for row in batch_rows for f, value in zip(fields, row)
+                ]
+                cursor.execute('INSERT INTO %s (%s) %s %s' % (table, columns, values_sql, suffix_sql), params)
+
+    def bulk_load(self, model, fields, rows):
+        self.insert(model, fields, rows)
+
+    def load(self, model, fields, rows):
+        """ 写入失败抛出 django.db.DatabaseError, 事务回滚 """
+        with transaction.atomic(using=self.alias):
+            if self.can_load(model, fields, rows):
+                self.bulk_load(model, fields, rows)
+            else:
+                self.insert(model, fields, rows)
+
+    def upsert(self, model, fields, rows):
+        """ 插入或按主键更新(增量同步), 原生批量导入不支持, 总是 INSERT """
+        with transaction.atomic(using=self.alias):
+            self.insert(model, fields, rows, upsert=True)
+
+
+class SpooledLoader(InsertLoader):
+    """ 厂商原生批量导入: 行数据按 format_value 编码为 CSV 文本, 缓冲方式由子类的 bulk_load 决定 """
+    MIN_ROWS = 16                       # 行数太少时 INSERT 更快(含二分定位坏行)
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+    def can_load(self, model, fields, rows):
+        return len(rows) >= self.MIN_ROWS
+
+    def format_value(self, field, value):
+        raise NotImplementedError
+
+    def write_rows(self, buffer, fields, rows):
+        for row in rows:
+            buffer.write(','.join(self.format_value(f, value) for f, value in zip(fields, row)))
+            buffer.write('\n')
+
+        buffer.seek(0)
+
+    def get_prep_value(self, field, value):
+        if isinstance(field, models.JSONField):
+            return json.dumps(value, cls=field.encoder)
+
+        return field.get_db_prep_save(value, connection=self.connection)
+
+
+class PostgresCopyLoader(SpooledLoader):
+    """ COPY table (columns) FROM STDIN WITH (FORMAT csv): 未加引号的空值为 NULL, 其它值都加引号
+
+    数据经连接流式发送, 缓冲在 SpooledTemporaryFile 中, 小 chunk 只在内存中, 超过 SPOOL_MAX_SIZE 才落盘
+    """
+    COPY_SQL = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)'
+
+    def format_value(self, field, value):
+        if value is None:
+            return ''
+
+        if isinstance(field, models.BinaryField):
+            # get_db_prep_save 返回驱动的 Binary 包装对象(非 bytes), 直接编码原始字节为 bytea 十六进制格式
+            value = field.to_python(value)
+        else:
+            value = self.get_prep_value(field, value)
+
+        if value is None:
+            return ''
+        elif isinstance(value, bool):
+            value = 't' if value else 'f'
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            value = '\\x' + bytes(value).hex()
+        else:
+            value = str(value)
+
+        return '"%s"' % value.replace('"', '""')
+
+    def bulk_load(self, model, fields, rows):
+        conn = self.connection
+        ops = conn.ops
+        sql = self.COPY_SQL % (ops.quote_name(model._meta.db_table), ', '.join(ops.quote_name(f.column) for f in fields))
+
+        with tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_SIZE, mode='w+', newline='') as buffer:
+            self.write_rows(buffer, fields, rows)
+
+            with conn.cursor() as cursor, conn.wrap_database_errors:
+                if hasattr(cursor, 'copy_expert'):
+                    # psycopg2
+                    cursor.copy_expert(sql, buffer, size=64 * 1024)
+                else:
+                    # psycopg 3
+                    with cursor.copy(sql) as copy:
+                        for data in iter(lambda: buffer.read(64 * 1024), ''):
+                            copy.write(data)
+
+
+class MySQLLoadDataLoader(SpooledLoader):
+    """
+    LOAD DATA LOCAL INFILE: 客户端只能读取文件路径, 所以总是落盘一个 NamedTemporaryFile, 只在行数较多时使用,
+    且需要 DATABASES['OPTIONS']['local_infile'] = 1 与服务端 local_infile=ON.
+    LOCAL 模式下重复键/数据错误只是警告(等同 IGNORE), 导入行数不符或有警告时抛出 DatabaseError,
+    事务回滚后由调用方逐行二分定位坏行
+    """
+    MIN_ROWS = 1000
+    LOAD_SQL = (
+        "LOAD DATA LOCAL INFILE %%s INTO TABLE %s CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+        "LINES TERMINATED BY '\\n' (%s)"
+    )
+    ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+    def can_load(self, model, fields, rows):
+        if not self.connection.settings_dict.get('OPTIONS', {}).get('local_infile'):
+            return False
+
+        # 二进制数据无法用文本格式导入
+        return super().can_load(model, fields, rows) and not any(isinstance(f, models.BinaryField) for f in fields)
+
+    def format_value(self, field, value):
+        if value is None:
+            return '\\N'
+
+        value = self.get_prep_value(field, value)
+
+        if value is None:
+            return '\\N'
+        elif isinstance(value, bool):
+            return '1' if value else '0'
+
+        return '"%s"' % str(value).translate(self.ESCAPES)
+
+    def bulk_load(self, model, fields, rows):
+        conn = self.connection
+        ops = conn.ops
+        sql = self.LOAD_SQL % (ops.quote_name(model._meta.db_table), ', '.join(ops.quote_name(f.column) for f in fields))
+
+        with tempfile.NamedTemporaryFile(mode='w+', encoding='utf-8', newline='', suffix='.csv') as buffer:
+            self.write_rows(buffer, fields, rows)
+            buffer.flush()
+
+            with conn.cursor() as cursor:
+                cursor.execute(sql, [buffer.name])
+                rowcount = cursor.rowcount
+
+                cursor.execute('SHOW WARNINGS')
+                warnings = [row for row in cursor.fetchall() if row[0] != 'Note']
+
+        if rowcount != len(rows) or warnings:
+            raise DatabaseError('LOAD DATA %s: %s of %s rows loaded, warnings: %s' % (
+                model._meta.db_table, rowcount, len(rows), warnings[:5]
+            ))
+
+
+LOADERS = {
+    'postgresql': PostgresCopyLoader,
+    'mysql': MySQLLoadDataLoader,
+}
+
+
+def get_loader(alias, bulk_load=True):
+    vendor = connections[alias].vendor
+    loader_class = bulk_load and LOADERS.get(vendor) or InsertLoader
+
+    return loader_class(alias)
@@ -1,23 +1,49 @@
 import logging
 import traceback
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from datetime import timedelta
 
 from django.apps import apps
 from django.utils.functional import cached_property
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
 from django.db import connections, models
+from django.db.models import Max, Q
 from django.db.utils import DEFAULT_DB_ALIAS, DatabaseError, ProgrammingError
 from django_redis import get_redis_connection
 
+from .loaders import get_loader
+from .planner import MigrationPlan
+
 
 class MigrateDatabase:
+    """
+    复制引擎:
+        1) 源库按主键键集分页(pk > last_pk LIMIT n), 服务端游标流式读取 tuple 行, 不实例化模型
+        2) 外键依赖的表全部完成后才开始复制, 互不依赖的表通过线程池并发复制
+        3) 每张表每写完一个 chunk 记录 last_pk 检查点(redis), 中断后从检查点继续
+        4) 目标库支持时使用原生批量导入(PostgreSQL COPY / MySQL LOAD DATA), 见 loaders.py
+
+    增量同步(sync): 按表记录 update_time 水位线(redis), 只把水位线之后变更的行(包括软删除 is_del)批量 upsert 到目标库,
+    全量复制完成的表同时记录复制开始时的水位线.
+    """
     TABLE_IGNORES = [
         'django_migrations', 'django_session', 'django_admin_log', 'django_content_type',
         'auth_group', 'auth_group_permissions', 'auth_permission'
     ]
 
-    def __init__(self, src_alias, dest_alias, chunk_size=None, ignore_tables=None):
+    # 每次键集分页读取 chunk_size * PAGE_CHUNKS 行, 避免一个游标长时间持有源库快照
+    PAGE_CHUNKS = 10
+    MIGRATED_EXPIRED = 24 * 60 * 60
+
+    WATERMARK_FIELD = 'update_time'
+    # 水位线回退的时间: 长事务提交晚于后续的变更时, 其 update_time 会小于已记录的水位线
+    WATERMARK_OVERLAP = timedelta(minutes=1)
+
+    def __init__(self, src_alias, dest_alias, chunk_size=None, ignore_tables=None, workers=None, bulk_load=True):
         self._chunk_size = chunk_size or 2000
+        self._workers = workers or 4
+        self._bulk_load = bulk_load
         self._src_alias = src_alias or DEFAULT_DB_ALIAS
         self._dest_alias = dest_alias or DEFAULT_DB_ALIAS
 
@@ -86,146 +112,298 @@ class MigrateDatabase:
         return bool(db_ret)
 
     def get_fields(self, model):
-        return [f for f in model._meta.fields]
+        return [f for f in model._meta.concrete_fields]
+
+    @cached_property
+    def migrated_key(self):
+        return 'migrated_%s_to_%s' % (self._src_alias, self._dest_alias)
+
+    @cached_property
+    def checkpoint_key(self):
+        return '%s:checkpoints' % self.migrated_key
+
+    def cache_migrated_tables(self, tables=None, expired=False):
+        redis = get_redis_connection()
+        migrated_key = self.migrated_key
+
+        cached_tables = redis.lrange(migrated_key, 0, -1) or []
+        cached_tables = [tn.decode() if isinstance(tn, bytes) else tn for tn in cached_tables]
+
+        if tables:
+            tables = [tn for tn in set(tables or []) if tn not in cached_tables]
+            tables and redis.lpush(migrated_key, *tables)
+
+            if expired:
+                redis.expire(migrated_key, self.MIGRATED_EXPIRED)
 
-    def get_related_models(self, model):
-        q = deque([model])
-        related_models = []
+            return
+
+        return cached_tables
+
+    def get_checkpoint(self, model):
+        """ 表的检查点: 已复制的最后一行 pk, None 表示从头开始 """
+        value = get_redis_connection().hget(self.checkpoint_key, model._meta.db_table)
+
+        if value is None:
+            return None
+
+        return model._meta.pk.to_python(value.decode() if isinstance(value, bytes) else value)
+
+    def save_checkpoint(self, model, pk):
+        redis = get_redis_connection()
+        redis.hset(self.checkpoint_key, model._meta.db_table, str(pk))
+        redis.expire(self.checkpoint_key, self.MIGRATED_EXPIRED)
+
+    def clear_checkpoint(self, model):
+        get_redis_connection().hdel(self.checkpoint_key, model._meta.db_table)
+
+    @cached_property
+    def watermark_key(self):
+        return '%s:watermarks' % self.migrated_key
 
-        while q:
-            model = q.popleft()
+    def get_watermark_field(self, model):
+        try:
+            return model._meta.get_field(self.WATERMARK_FIELD)
+        except FieldDoesNotExist:
+            return None
 
-            if model not in related_models:
-                related_models.append(model)
+    def get_watermark(self, model):
+        value = get_redis_connection().hget(self.watermark_key, model._meta.db_table)
 
-            for f in self.get_fields(model):
-                # many2many: f.is_relation and f.many_to_many
-                # one2many: f.is_relation and f.one_to_many
-                # foreignKey: many2one
-                if f.is_relation and f.many_to_one:
-                    rel_model = f.related_model
+        if value is None:
+            return None
 
-                    # 无外循外键
-                    if rel_model not in related_models:
-                        q.append(rel_model)
-                        related_models.append(rel_model)
+        return self.get_watermark_field(model).to_python(value.decode() if isinstance(value, bytes) else value)
 
-        # 无任何关联表的模型
-        for index, rel_model in enumerate(related_models[::]):
-            if not any([f.is_relation and f.many_to_one for f in self.get_fields(rel_model)]):
-                related_models.pop(index)
-                related_models.append(rel_model)
+    def save_watermark(self, model, value):
+        # 水位线长期有效, 不设置过期时间
+        value is not None and get_redis_connection().hset(self.watermark_key, model._meta.db_table, value.isoformat())
 
-        return related_models
+    def get_max_watermark(self, model):
+        return model._default_manager.using(self._src_alias).aggregate(value=Max(self.WATERMARK_FIELD))['value']
 
-    def get_queryset(self, model, start=None, alias=None):
+    def iter_chunks(self, model, fields, start=None):
         """
         :param model: ModelBase, ORM
-        :param start: int | None, 上次queryset中最后一条记录的pk值
-        :param alias: database's alias
-        :return: Queryset
+        :param fields: 复制的字段, 行内顺序与之一致
+        :param start: 上次复制的最后一行 pk, 从其后开始
+        :return: 迭代 [tuple, ...], 每次最多 chunk_size 行
         """
-        queryset = model._default_manager.using(alias or self._src_alias).order_by('pk').all()
+        pk_index = fields.index(model._meta.pk)
+        page_size = self._chunk_size * self.PAGE_CHUNKS
+        queryset = model._default_manager.using(self._src_alias).order_by('pk')
 
-        # 探测: {pk} 开始或中间可能不连续，需要每次传入最后一行记录pk参数 {start}
-        #       如果不连续的间隔大于 {chunk_size}, 将导致取数失败, 所以必须探测
-        if start is None:
-            offset = 0
-            first_obj = queryset.first()
-        else:
-            start += 1  # 上一次最后一条pk值(已存在)
-            offset = start
-            first_obj = queryset.filter(pk__gte=start).first()
+        while True:
+            page_queryset = queryset if start is None else queryset.filter(pk__gt=start)
+            page_queryset = page_queryset.values_list(*[f.attname for f in fields])[:page_size]
 
-        start = first_obj and first_obj.pk or offset
-        end = start + self._chunk_size  # 以 chunk_size 为基准分片同步数据
+            chunk, row_count = [], 0
 
-        query = dict(pk__gte=start, pk__lt=end)
-        log_args = (model.__name__, model._meta.db_table, query)
-        self.logger.info("MigrateDatabase.migrate => <%s:%s> get_queryset -> query: %s", *log_args)
+            for row in page_queryset.iterator(chunk_size=self._chunk_size):
+                chunk.append(row)
+                row_count += 1
 
-        return queryset.filter(**query).all()
+                if len(chunk) >= self._chunk_size:
+                    yield chunk
+                    chunk = []
 
-    def cache_migrated_tables(self, tables=None, expired=False):
-        redis = get_redis_connection()
-        migrated_key = 'migrated_%s_to_%s' % (self._src_alias, self._dest_alias)
+            if chunk:
+                yield chunk
 
-        cached_tables = redis.lrange(migrated_key, 0, -1) or []
-        cached_tables = [tn.decode() if isinstance(tn, bytes) else tn for tn in cached_tables]
+            if row_count < page_size:
+                break
 
-        if tables:
-            tables = [tn for tn in set(tables or []) if tn not in cached_tables]
-            tables and redis.lpush(migrated_key, *tables)
+            start = row[pk_index]
 
-            if expired:
-                redis.expire(migrated_key, 24 * 60 * 60)
+    def exclude_existed_rows(self, model, rows, pk_index):
+        """ 只在本 chunk 的 pk 范围内查询目标库已存在的行 """
+        dest_existed_ids = set(
+            model._default_manager.using(self._dest_alias)
+            .filter(pk__gte=rows[0][pk_index], pk__lte=rows[-1][pk_index])
+            .values_list('pk', flat=True)
+        )
 
-            return
+        if not dest_existed_ids:
+            return rows
 
-        return cached_tables
+        return [row for row in rows if row[pk_index] not in dest_existed_ids]
+
+    @cached_property
+    def loader(self):
+        return get_loader(self._dest_alias, bulk_load=self._bulk_load)
+
+    def write_rows(self, model, fields, rows, upsert=False):
+        """ 写入失败时二分定位坏行, 而不是逐行插入, 返回写入的行数 """
+        try:
+            (self.loader.upsert if upsert else self.loader.load)(model, fields, rows)
+            return len(rows)
+        except DatabaseError as e:
+            if len(rows) == 1:
+                self.logger.error('MigrateDatabase.write_rows => %s row<%s> error: %s', model.__name__, rows[0], e)
+                return 0
+
+            self.logger.info('MigrateDatabase.write_rows => %s %s rows error, bisect: %s', model.__name__, len(rows), e)
+
+        middle = len(rows) // 2
+        return self.write_rows(model, fields, rows[:middle], upsert) + self.write_rows(model, fields, rows[middle:], upsert)
 
     def sync_model(self, model):
         model_name = model.__name__
-        model_manager = model._default_manager  # equal to model.objects
+        fields = self.get_fields(model)
+        pk_index = fields.index(model._meta.pk)
 
-        fields = [f.attname for f in self.get_fields(model)]
-        dest_existed_ids = set(model_manager.using(self._dest_alias).values_list('pk', flat=True))
+        start = self.get_checkpoint(model)
+        start is not None and self.logger.info("MigrateDatabase.sync_model => %s resume after pk: %s", model_name, start)
 
-        src_queryset = self.get_queryset(model)
+        for chunk in self.iter_chunks(model, fields, start=start):
+            rows = self.exclude_existed_rows(model, chunk, pk_index)
+            row_count = rows and self.write_rows(model, fields, rows) or 0
+            self.save_checkpoint(model, chunk[-1][pk_index])
 
-        while src_queryset.count() > 0:
-            pk_start = getattr(src_queryset.last(), 'pk')
-            object_kwargs_list = [
-                {name: getattr(src_object, name, None) for name in fields}
-                for src_object in src_queryset
-                if src_object.pk not in dest_existed_ids
-            ]
+            log_args = (model_name, model._meta.db_table, row_count, self._dest_alias)
+            self.logger.info("MigrateDatabase.migrate => <%s: %s> %s rows will migrate to `%s`", *log_args)
 
-            try:
-                bulk_objects = [model(**model_kwargs) for model_kwargs in object_kwargs_list]
-                model_manager.using(self._dest_alias).bulk_create(bulk_objects)
-            except DatabaseError as e:
-                self.logger.error('MigrateDatabase.sync_model => bulk_create to error: %s', e)
-                self.logger.error(traceback.format_exc())
+    def sync_model_changes(self, model):
+        """ 增量同步: 按 (update_time, pk) 键集分页读取水位线之后变更的行, 批量 upsert """
+        model_name = model.__name__
+        fields = self.get_fields(model)
+        watermark_field = self.get_watermark_field(model)
 
-                for model_kwargs in object_kwargs_list:
-                    try:
-                        model_manager.using(self._dest_alias).create(**model_kwargs)
-                    except DatabaseError as e:
-                        self.logger.info('MigrateDatabase.sync_model => create error: %s', e)
-                        self.logger.error(traceback.format_exc())
+        if watermark_field is None:
+            self.logger.warning("MigrateDatabase.sync => %s has no `%s`, ignored", model_name, self.WATERMARK_FIELD)
+            return
 
-            log_args = (model_name, model._meta.db_table, len(object_kwargs_list), self._dest_alias)
-            self.logger.info("MigrateDatabase.migrate => <%s: %s> %s rows will migrate to `%s`", *log_args)
+        pk_index, time_index = fields.index(model._meta.pk), fields.index(watermark_field)
+        watermark = self.get_watermark(model)
+        queryset = model._default_manager.using(self._src_alias).order_by(self.WATERMARK_FIELD, 'pk')
+        queryset = queryset.values_list(*[f.attname for f in fields])
 
-            src_queryset = self.get_queryset(model, start=pk_start)
+        if watermark is not None:
+            watermark -= self.WATERMARK_OVERLAP
+            queryset = queryset.filter(**{self.WATERMARK_FIELD + '__gte': watermark})
 
-    def migrate(self, models=None):
-        app_models = apps.get_models()
+        last_row = None
+
+        while True:
+            if last_row is None:
+                rows = list(queryset[:self._chunk_size])
+            else:
+                last_time, last_pk = last_row[time_index], last_row[pk_index]
+                keyset = Q(**{self.WATERMARK_FIELD + '__gt': last_time}) | Q(**{self.WATERMARK_FIELD: last_time, 'pk__gt': last_pk})
+                rows = list(queryset.filter(keyset)[:self._chunk_size])
+
+            if not rows:
+                break
+
+            row_count = self.write_rows(model, fields, rows, upsert=True)
+            last_row = rows[-1]
+            self.save_watermark(model, last_row[time_index])
+
+            log_args = (model_name, model._meta.db_table, row_count, self._dest_alias)
+            self.logger.info("MigrateDatabase.sync => <%s: %s> %s changed rows upsert to `%s`", *log_args)
+
+            if len(rows) < self._chunk_size:
+                break
+
+    def migrate_model(self, model, incremental=False):
+        model_name, db_table = model.__name__, model._meta.db_table
+
+        try:
+            if not self.check_table(db_table, alias=self._dest_alias):
+                return
+
+            if incremental:
+                self.sync_model_changes(model)
+                return
+
+            self.logger.info("MigrateDatabase.migrate => %s<%s> start to migrate now.", model_name, db_table)
+
+            # 复制开始前的水位线, 复制完成后增量同步从这里继续
+            watermark = self.get_watermark_field(model) and self.get_max_watermark(model)
+            self.sync_model(model)
+            watermark and self.save_watermark(model, watermark)
+
+            if connections[self._dest_alias].vendor == 'postgresql':
+                self.reset_sql_sequence(db_table, pk_name=model._meta.pk.column)
+
+            self.cache_migrated_tables([db_table])
+            self.clear_checkpoint(model)
+        finally:
+            # 工作线程的数据库连接
+            connections.close_all()
+
+    def plan(self, models=None):
+        """ 迁移计划: models 及其外键依赖的全部模型, 默认全部 models """
         models = isinstance(models, list) and models or (models and [models] or [])
+        plan = MigrationPlan(models or apps.get_models())
+
+        for cycle in plan.cycles:
+            self.logger.warning("MigrateDatabase.plan => cyclic dependencies: %s", [m._meta.db_table for m in cycle])
+
+        return plan
 
-        for app_model in models or app_models:
-            related_models = self.get_related_models(app_model)
-            self.logger.info('MigrateDatabase.migrate => related_models: %s', related_models)
+    def copy_models(self, plan, incremental=False):
+        """ 按拓扑分层提交, 依赖的表全部完成后即可开始(不等待整层), 互不依赖的表并发复制 """
+        migrated_tables = set() if incremental else set(self.cache_migrated_tables())
+        pending = {}
 
-            for model in related_models[::-1]:
-                model_name = model.__name__
-                meta = model._meta
-                db_table = meta.db_table
-                migrated_tables = self.cache_migrated_tables()
+        for wave in plan.waves:
+            for model in wave:
+                if model._meta.db_table in migrated_tables:
+                    self.logger.info("MigrateDatabase.migrate => %s<%s> has already ignored", model.__name__, model._meta.db_table)
+                else:
+                    pending[model] = None
 
-                if db_table in migrated_tables:
-                    self.logger.info("MigrateDatabase.migrate => %s<%s> has already ignored", model_name, db_table)
-                    continue
+        pending = {model: plan.dependencies[model] & pending.keys() for model in pending}
+        running = {}
 
-                if not self.check_table(db_table, alias=self._dest_alias):
-                    continue
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='db_migration') as executor:
+            while pending or running:
+                for model in [model for model, dependencies in pending.items() if not dependencies]:
+                    pending.pop(model)
+                    running[executor.submit(self.migrate_model, model, incremental)] = model
+
+                done_futures, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done_futures:
+                    model = running.pop(future)
+                    failed_models = {model} if future.exception() is not None else set()
+
+                    if failed_models:
+                        self.logger.error("MigrateDatabase.migrate => %s failed: %s", model.__name__, future.exception())
+
+                    # 失败表的下游表(递归)不再复制
+                    while failed_models:
+                        failed_model = failed_models.pop()
+
+                        for dependent_model, dependencies in list(pending.items()):
+                            if failed_model in dependencies:
+                                pending.pop(dependent_model)
+                                failed_models.add(dependent_model)
+                                self.logger.error("MigrateDatabase.migrate => %s skipped", dependent_model.__name__)
+
+                    for dependencies in pending.values():
+                        dependencies.discard(model)
+
+    def dry_run(self, models=None, rows_per_second=None, exact=False):
+        """ 只输出迁移计划: 每一层的表、行数与估计耗时, 不复制数据 """
+        return self.plan(models).dry_run(
+            self._src_alias, workers=self._workers, rows_per_second=rows_per_second,
+            exact=exact, ignore_tables=self.cache_migrated_tables()
+        )
+
+    def migrate(self, models=None, incremental=False):
+        """
+        :param models: ModelBase | [ModelBase, ...], 默认全部 models
+        :param incremental: True 增量同步(update_time 水位线之后变更的行), 用于定时同步备库
+        """
+        plan = self.plan(models)
+        self.logger.info('MigrateDatabase.migrate => waves: %s', plan.waves)
 
-                self.logger.info("MigrateDatabase.migrate => %s<%s> start to migrate now.", model_name, db_table)
+        self.copy_models(plan, incremental=incremental)
 
-                self.sync_model(model)
-                self.reset_sql_sequence(db_table, pk_name=meta.pk.name)
-                self.cache_migrated_tables([db_table])
+    def sync(self, models=None):
+        self.migrate(models, incremental=True)
 
     def reset_sql_sequence(self, table_name=None, pk_name=None):
         app_models = apps.get_models()
@@ -247,7 +425,7 @@ class MigrateDatabase:
 
         for db_table, pk_name in seq_list:
             set_seq_sql = "SELECT SETVAL(pg_get_serial_sequence('%s','%s'), (SELECT MAX(%s) FROM %s) + 1);"
-            params = (table_name, pk_name, pk_name, table_name)
+            params = (db_table, pk_name, pk_name, db_table)
             self.logger.info('MigrateDatabase.reset_sql_sequence => SQL: %s', set_seq_sql % params)
 
             try:
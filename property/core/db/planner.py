@@ -0,0 +1,174 @@
+from collections import deque
+
+from django.db import connections
+
+__all__ = ('MigrationPlan', )
+
+
+class MigrationPlan:
+    """
+    迁移计划: 一次性构建全部模型的外键依赖图(DAG)
+
+        dependencies: {model: {依赖(外键指向)的 model, ...}}, 循环依赖的模型之间不再互相依赖
+        cycles: [[model, ...], ...], 外键循环依赖的模型组(强连通分量)
+        waves: [[model, ...], ...], 拓扑分层, 同一层的表互不依赖可以并发复制, 依赖的表都在之前的层
+    """
+    ESTIMATED_ROWS_PER_SECOND = 10000
+
+    def __init__(self, models):
+        self.models = self.get_related_models(models)
+        self.graph = {model: self.get_parents(model) for model in self.models}
+
+        self.cycles = [component for component in self.get_components() if len(component) > 1]
+        self.dependencies = self.get_dependencies()
+        self.waves = self.get_waves()
+
+    @staticmethod
+    def get_parents(model):
+        return {
+            f.related_model._meta.concrete_model for f in model._meta.concrete_fields
+            if f.is_relation and f.many_to_one
+        } - {model}
+
+    def get_related_models(self, models):
+        """ 模型及其外键依赖的全部模型(BFS, 同一张表的代理模型只保留 concrete model) """
+        queue = deque(model._meta.concrete_model for model in models)
+        related_models = dict.fromkeys(queue)
+
+        while queue:
+            for parent_model in self.get_parents(queue.popleft()):
+                if parent_model not in related_models:
+                    related_models[parent_model] = None
+                    queue.append(parent_model)
+
+        return list(related_models)
+
+    def get_components(self):
+        """ Tarjan 强连通分量(迭代实现, 避免递归过深) """
+        index_of, low_of, on_stack = {}, {}, set()
+        stack, components, counter = [], [], 0
+
+        for root in self.graph:
+            if root in index_of:
+                continue
+
+            work = [(root, iter(self.graph[root]))]
+            index_of[root] = low_of[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+
+            while work:
+                node, parents = work[-1]
+                parent = next(parents, None)
+
+                if parent is not None:
+                    if parent not in index_of:
+                        index_of[parent] = low_of[parent] = counter
+                        counter += 1
+                        stack.append(parent)
+                        on_stack.add(parent)
+                        work.append((parent, iter(self.graph[parent])))
+                    elif parent in on_stack:
+                        low_of[node] = min(low_of[node], index_of[parent])
+                    continue
+
+                work.pop()
+
+                if work:
+                    caller = work[-1][0]
+                    low_of[caller] = min(low_of[caller], low_of[node])
+
+                if low_of[node] == index_of[node]:
+                    component = []
+
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+
+                        if member is node:
+                            break
+
+                    components.append(component)
+
+        return components
+
+    def get_dependencies(self):
+        cycle_of = {model: set(component) for component in self.cycles for model in component}
+        return {model: parents - cycle_of.get(model, set()) for model, parents in self.graph.items()}
+
+    def get_waves(self):
+        """ Kahn 拓扑排序, 按层输出 """
+        in_degrees = {model: len(parents) for model, parents in self.dependencies.items()}
+        children = {model: [] for model in self.dependencies}
+
+        for model, parents in self.dependencies.items():
+            for parent_model in parents:
+                children[parent_model].append(model)
+
+        wave = [model for model, degree in in_degrees.items() if degree == 0]
+        waves = []
+
+        while wave:
+            waves.append(wave)
+            next_wave = []
+
+            for model in wave:
+                for child_model in children[model]:
+                    in_degrees[child_model] -= 1
+                    in_degrees[child_model] or next_wave.append(child_model)
+
+            wave = next_wave
+
+        return waves
+
+    @staticmethod
+    def get_row_count(model, alias, exact=False):
+        """ 表的行数, 默认使用数据库统计信息中的估计值(大表 COUNT(*) 很慢) """
+        conn = connections[alias]
+        db_table = model._meta.db_table
+
+        if not exact and conn.vendor in ('postgresql', 'mysql'):
+            if conn.vendor == 'postgresql':
+                sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)"
+            else:
+                sql = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+
+            with conn.cursor() as cursor:
+                cursor.execute(sql, [db_table])
+                row = cursor.fetchone()
+
+            # reltuples = -1: 从未 ANALYZE
+            if row and row[0] is not None and row[0] >= 0:
+                return int(row[0])
+
+        return model._default_manager.using(alias).count()
+
+    def dry_run(self, alias, workers=4, rows_per_second=None, exact=False, ignore_tables=None):
+        """
+        :return: {'waves': [[{'table':, 'model':, 'rows':, 'seconds':}, ...], ...], 'cycles': [[table, ...]], 'seconds': 总估计时间}
+        """
+        rows_per_second = rows_per_second or self.ESTIMATED_ROWS_PER_SECOND
+        ignore_tables = set(ignore_tables or [])
+        report = dict(waves=[], cycles=[[m._meta.db_table for m in cycle] for cycle in self.cycles], seconds=0)
+
+        for wave in self.waves:
+            tables = []
+
+            for model in wave:
+                if model._meta.db_table in ignore_tables:
+                    continue
+
+                rows = self.get_row_count(model, alias, exact=exact)
+                tables.append(dict(
+                    table=model._meta.db_table, model=model._meta.label, rows=rows, seconds=rows / rows_per_second
+                ))
+
+            if tables:
+                # 同一层的表并发复制: 受最大的表与并发数共同限制
+                seconds = [item['seconds'] for item in tables]
+                report['seconds'] += max(max(seconds), sum(seconds) / workers)
+                report['waves'].append(tables)
+
+        return report
@@ -0,0 +1,110 @@
+import zlib
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+__all__ = ('ShardRule', 'HashShardRule', 'RangeShardRule', 'DateShardRule')
+
+
+class ShardRule:
+    """
+    分片规则: 分片键 -> (分表名, 数据库别名), 别名为 None 时由 DATABASE_ROUTERS 决定
+
+        class UserLogModel(BaseModelMixin):
+            shard_rule = HashShardRule('user_log_%s', shards=16, aliases=['default', 'log'])
+
+        UserLogModel.shard_objects(user_id).filter(...)
+    """
+
+    def __init__(self, table_format, aliases=None):
+        self.table_format = table_format
+        self.aliases = list(aliases or [])
+
+    def get_index(self, key):
+        raise NotImplementedError
+
+    def get_indexes(self, **kwargs):
+        """ 全部分片的 index """
+        raise NotImplementedError
+
+    def get_table(self, index):
+        return self.table_format % index
+
+    def get_alias(self, index):
+        return self.aliases[index % len(self.aliases)] if self.aliases else None
+
+    def __call__(self, key):
+        index = self.get_index(key)
+        return self.get_table(index), self.get_alias(index)
+
+    def get_shards(self, keys=None, **kwargs):
+        """ [(table, alias), ...], keys 为 None 时返回全部分片, 去重并保持顺序 """
+        indexes = self.get_indexes(**kwargs) if keys is None else [self.get_index(key) for key in keys]
+        return list(dict.fromkeys((self.get_table(index), self.get_alias(index)) for index in indexes))
+
+
+class HashShardRule(ShardRule):
+    """ 整数取模, 其它类型按 crc32(跨进程稳定, 不能用 hash()) 取模 """
+
+    def __init__(self, table_format, shards, aliases=None):
+        super().__init__(table_format, aliases=aliases)
+        self.shards = shards
+
+    def get_index(self, key):
+        if not isinstance(key, int):
+            key = zlib.crc32(str(key).encode('utf-8'))
+
+        return key % self.shards
+
+    def get_indexes(self, **kwargs):
+        return range(self.shards)
+
+
+class RangeShardRule(ShardRule):
+    """ boundaries=[100万, 200万]: key < 100万 -> 0, 100万 <= key < 200万 -> 1, 其它 -> 2 """
+
+    def __init__(self, table_format, boundaries, aliases=None):
+        super().__init__(table_format, aliases=aliases)
+        self.boundaries = sorted(boundaries)
+
+    def get_index(self, key):
+        return bisect_right(self.boundaries, key)
+
+    def get_indexes(self, **kwargs):
+        return range(len(self.boundaries) + 1)
+
+
+class DateShardRule(ShardRule):
+    """
+    按日期分表, table_format 为 strftime 格式: 'user_log_%Y%m'(按月), 'user_log_%Y%m%d'(按天), 'user_log_%Y'(按年)
+    多个分片需要指定时间范围: get_shards(start=date(2023, 1, 1), end=date(2023, 12, 31))
+    多个数据库别名时按表名(crc32)分配, 同一张分表的每一天都在同一个库
+    """
+
+    def __init__(self, table_format, aliases=None):
+        super().__init__(table_format, aliases=aliases)
+
+    def get_index(self, key):
+        return key.date() if isinstance(key, datetime) else key
+
+    def get_indexes(self, start=None, end=None, **kwargs):
+        if start is None or end is None:
+            raise ValueError('DateShardRule<%s> needs `start` and `end` for multiple shards' % self.table_format)
+
+        day, end = self.get_index(start), self.get_index(end)
+        indexes = []
+
+        # 逐天生成, 由 get_shards 按表名去重(按月/按年的分表)
+        while day <= end:
+            indexes.append(day)
+            day += timedelta(days=1)
+
+        return indexes
+
+    def get_table(self, index):
+        return index.strftime(self.table_format)
+
+    def get_alias(self, index):
+        if not self.aliases:
+            return None
+
+        return self.aliases[zlib.crc32(self.get_table(index).encode('utf-8')) % len(self.aliases)]
@@ -0,0 +1,51 @@
+import json
+from copy import copy
+
+from django.db import models
+from django.dispatch import Signal
+
+__all__ = ('post_bulk_update', 'is_audited')
+
+# queryset.bulk_update_attrs / soft_delete 之后发送(queryset.update 不触发 pre_save/post_save)
+#   sender: model class
+#   pks: 更新的行的主键
+#   changes: {field: value}
+#   old_objects: {pk: 更新前的对象}, 只有 auditlog 注册的模型才加载, 否则为 None
+#   using: database alias
+post_bulk_update = Signal()
+
+
+def is_audited(model):
+    try:
+        from auditlog.registry import auditlog
+    except ImportError:
+        return False
+
+    return auditlog.contains(model)
+
+
+def audit_bulk_update(sender, pks, changes, old_objects=None, **kwargs):
+    """ 批量更新同样写入 auditlog 的 LogEntry(与 save() 时的 auditlog 记录一致) """
+    if not old_objects:
+        return
+
+    from auditlog.diff import model_instance_diff
+    from auditlog.models import LogEntry
+
+    # django-auditlog < 3: changes 是 json 文本
+    is_json_field = isinstance(LogEntry._meta.get_field('changes'), models.JSONField)
+
+    for old_obj in old_objects.values():
+        new_obj = copy(old_obj)
+
+        for attr, value in changes.items():
+            setattr(new_obj, attr, value)
+
+        diff = model_instance_diff(old_obj, new_obj)
+
+        if diff:
+            diff = diff if is_json_field else json.dumps(diff)
+            LogEntry.objects.log_create(new_obj, action=LogEntry.Action.UPDATE, changes=diff)
+
+
+post_bulk_update.connect(audit_bulk_update, dispatch_uid='core_db_audit_bulk_update')
@@ -0,0 +1,78 @@
+import json
+
+from django.http import JsonResponse
+from django.http.response import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from constant.status import StatusEnum
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_PREFIX = '/api/'
+STATIC_SUFFIXES = ('.css', '.less', 'sass', '.js')
+
+_default_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """ 序列化为 bytes: 优先 orjson, 日期时间、Decimal、UUID、QuerySet 等交给 DRF 的 JSONEncoder(与 JSONRenderer 的格式一致) """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(data, default=_default_encoder.default, option=option)
+
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def envelope(raw_data, status_code=200):
+    """ 统一响应格式: {code, errmsg, data} """
+    data = dict(code=StatusEnum.OK.code, errmsg=StatusEnum.OK.msg, data=None)
+
+    if status.is_success(status_code):
+        data.update(data=raw_data)
+    else:
+        raw_data = raw_data if isinstance(raw_data, dict) else {}
+        code = raw_data.pop("code", None) or status_code
+        data.update(code=code, errmsg=str(raw_data.pop("message", "")))
+
+    return data
+
+
+def should_envelope(path, response):
+    """ /api/ 接口需要包装, 静态文件、附件与标记 _raw_response 的响应直接返回 """
+    if not path.startswith(API_PREFIX) or path.endswith(STATIC_SUFFIXES):
+        return False
+
+    return not getattr(response, "_raw_response", False) and not response.get("Content-Disposition")
+
+
+class ApiJSONRenderer(JSONRenderer):
+    """ 在渲染阶段包装统一响应格式, 数据只序列化一次, ApiResponseMiddleware 不再解析 """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        request = renderer_context.get("request")
+        response = renderer_context.get("response")
+
+        if request is not None and response is not None and should_envelope(request.path, response):
+            data = envelope(data, response.status_code)
+            response._enveloped = True
+        elif data is None:
+            return b''
+
+        return dumps(data)
+
+
+class ApiJsonResponse(JsonResponse):
+    """ 已包装统一响应格式的 JsonResponse, enveloped=False 时按 status 包装 data """
+
+    def __init__(self, data, status=200, enveloped=False, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+
+        # 不使用 JsonResponse 的 json.dumps
+        HttpResponse.__init__(self, content=dumps(data if enveloped else envelope(data, status)), status=status, **kwargs)
+        self._enveloped = True
@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from whitenoise.storage import CompressedStaticFilesStorage
+
+__all__ = ('ScriptManifest', 'script_manifest', 'ScriptManifestStaticFilesStorage')
+
+logger = logging.getLogger('django')
+
+
+class ScriptManifest:
+    """ STATICFILES_DIRS 中 src/<dir>/ 下脚本的清单, 供 simple tag: reload_javascript 使用
+
+        清单: {dir: [static path, ...]}, 顺序同原来的 os.walk(topdown=False)
+        collectstatic 时(ScriptManifestStaticFilesStorage.post_process)写入 STATIC_ROOT/{manifest_name}, 进程启动后首次使用时读取(不存在时扫描一次), 之后只读内存
+        按 script_dirs 缓存生成的 <script> 标签; bundle=True 时合并为一个内容哈希命名的脚本(浏览器可永久缓存),
+        合并脚本的 script_dirs 规范化为清单顺序、去重的元组(同一组目录只有一个 URL), 进程内最多缓存 bundle_cache_size 个
+        autorefresh(默认 DEBUG)时每次重新扫描, 开发环境新增的文件立即生效
+    """
+    manifest_name = 'script-manifest.json'
+    script_tag = '<script type="text/javascript" src="%s"></script>'
+    exclude_files = ('login.js', )
+
+    def __init__(self, autorefresh=False, bundle_cache_size=32):
+        self.autorefresh = autorefresh
+        self.bundle_cache_size = bundle_cache_size
+        self._manifest = None
+        self._tags = {}
+        self._bundles = OrderedDict()   # script_dirs -> (digest, bytes), LRU
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(settings.STATIC_ROOT, self.manifest_name)
+
+    def scan(self):
+        manifest = {}
+
+        for static_dir in settings.STATICFILES_DIRS:
+            static_dir = str(static_dir)
+
+            for root, dirs, files in os.walk(static_dir, topdown=False):
+                static_path = root[len(static_dir) + 1:]
+
+                try:
+                    entry, pathname = static_path.split(os.sep, 2)[:2]
+                except ValueError:
+                    continue
+
+                if entry != 'src':
+                    continue
+
+                manifest.setdefault(pathname, []).extend(
+                    os.path.join('/', static_path, filename).replace(os.sep, '/')
+                    for filename in files if filename not in self.exclude_files
+                )
+
+        return manifest
+
+    def write(self):
+        """ collectstatic 之后调用 """
+        manifest = self.scan()
+
+        with open(self.manifest_path, 'w', encoding='utf-8') as fp:
+            json.dump(manifest, fp, ensure_ascii=False)
+
+        self.clear()
+        return manifest
+
+    def load(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return self.scan()
+
+    @property
+    def manifest(self):
+        if self.autorefresh:
+            return self.scan()
+
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = self.load()
+
+        return self._manifest
+
+    def clear(self):
+        with self._lock:
+            self._manifest = None
+            self._tags.clear()
+            self._bundles.clear()
+
+    def get_scripts(self, script_dirs):
+        """ 按 STATICFILES_DIRS 扫描顺序(不是 script_dirs 的顺序)返回, 与原来一致 """
+        script_dirs = set(script_dirs)
+        return [path for pathname, paths in self.manifest.items() if pathname in script_dirs for path in paths]
+
+    def normalize(self, script_dirs):
+        """ 清单顺序、去重的 script_dirs 元组, 不在清单中的目录被忽略 """
+        script_dirs = set(script_dirs)
+        return tuple(pathname for pathname in self.manifest if pathname in script_dirs)
+
+    def build_bundle(self, script_dirs):
+        """ :return: (digest, content) """
+        contents = []
+
+        for path in self.get_scripts(script_dirs):
+            absolute_path = finders.find(path.lstrip('/'))
+
+            if absolute_path is None:
+                logger.warning('ScriptManifest.build_bundle => static file not found: %s', path)
+                continue
+
+            with open(absolute_path, 'rb') as fp:
+                contents.append(fp.read())
+
+        # 分号避免相邻文件因自动插入分号(ASI)规则拼接出错
+        content = b'\n;\n'.join(contents)
+        return hashlib.md5(content).hexdigest()[:16], content
+
+    def get_bundle(self, script_dirs):
+        """ 各 worker 独立生成, 同样的文件内容得到同样的 digest
+
+        :param script_dirs: normalize 之后的元组
+        """
+        if self.autorefresh:
+            return self.build_bundle(script_dirs)
+
+        with self._lock:
+            bundle = self._bundles.get(script_dirs)
+
+            if bundle is not None:
+                self._bundles.move_to_end(script_dirs)
+                return bundle
+
+        bundle = self.build_bundle(script_dirs)
+
+        with self._lock:
+            self._bundles[script_dirs] = bundle
+
+            while len(self._bundles) > self.bundle_cache_size:
+                self._bundles.popitem(last=False)
+
+        return bundle
+
+    def render(self, script_dirs, bundle=False):
+        """ :param script_dirs: tuple of src/ 下的目录名 """
+        key = (tuple(script_dirs), bool(bundle))
+        tags = None if self.autorefresh else self._tags.get(key)
+
+        if tags is None:
+            scripts = self.get_scripts(script_dirs)
+
+            if bundle and scripts:
+                from django.urls import reverse
+
+                script_dirs = self.normalize(script_dirs)
+                digest, _ = self.get_bundle(script_dirs)
+                url = reverse('generics_script_bundle', kwargs=dict(script_dirs=','.join(script_dirs), digest=digest))
+                tags = self.script_tag % url
+            else:
+                tags = "\n".join(self.script_tag % static(path) for path in scripts)
+
+            self._tags[key] = tags
+
+        return tags
+
+
+script_manifest = ScriptManifest(
+    autorefresh=getattr(settings, 'SCRIPT_MANIFEST_AUTOREFRESH', settings.DEBUG),
+    bundle_cache_size=getattr(settings, 'SCRIPT_BUNDLE_CACHE_SIZE', 32),
+)
+
+
+class ScriptManifestStaticFilesStorage(CompressedStaticFilesStorage):
+    """ collectstatic 之后生成 reload_javascript 的脚本清单 """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        if not dry_run:
+            script_manifest.write()
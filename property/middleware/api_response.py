@@ -1,23 +1,24 @@
-import re
 import json
 import logging
 import traceback
 
-from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
-from django.template.response import TemplateResponse
-from django.http.response import HttpResponseBase
-from django.http import JsonResponse, StreamingHttpResponse, HttpResponseRedirect
+from django.http import StreamingHttpResponse
 
-from rest_framework import status
 from rest_framework.response import Response
 
-from constant.status import StatusEnum
+from core.drf.renderers import ApiJsonResponse, envelope, should_envelope
 
 logger = logging.getLogger('django')
 
 
 class ApiResponseMiddleware(MiddlewareMixin):
+    """
+    统一响应格式 {code, errmsg, data}:
+        DRF 响应在渲染阶段由 core.drf.renderers.ApiJSONRenderer 包装, ApiJsonResponse 创建时包装, 这里直接返回;
+        其它 /api/ 响应(自定义 renderer_classes、普通 JsonResponse)才在这里解析并包装
+    """
+
     def process_exception(self, request, exc):
         """ 处理Django异常, DRF框架有自己的异常处理钩子 """
         logger.info("%s.process_exception => request: %s, exc: %s", self.__class__.__name__, request, exc)
@@ -31,74 +32,53 @@ class ApiResponseMiddleware(MiddlewareMixin):
         else:
             errmsg = exc_args[0] if exc_args else getattr(exc, "msg", str(exc))
 
-        data = dict(code=code, errmsg=errmsg)
+        data = dict(code=code, errmsg=str(errmsg), data=None)
 
         # 基本的异常处理, 默认path为 /api/ 或 视图类有API的认为是接口API
         if request.path.startswith("/api/"):
-            return JsonResponse(data=data, status=500)
+            return ApiJsonResponse(data=data, status=500, enveloped=True)
 
     def process_request(self, request):
         pass
 
     def process_response(self, request, response):
-        path = request.path
-        logger.info("%s.process_response => Request: %s, Response:%s", self.__class__.__name__, request, response)
-
         # 微信
         # if path.startswith(reverse("wechat_robot")):
         #     return response
 
-        # Django-Debug-Toolbar
-        if path.startswith("/__debug__/"):
+        if getattr(response, "_enveloped", False) or not should_envelope(request.path, response):
             return response
 
-        # 直接返回response:
-        if getattr(response, "_raw_response", False):
+        if isinstance(response, StreamingHttpResponse):
             return response
 
-        # 附件
-        if response.get("Content-Disposition"):
-            return response
-
-        # 静态文件
-        if path.startswith('/static/') or any([path.endswith(ext) for ext in ['.css', '.less', 'sass', '.js']]):
-            return response
-
-        if any([
-            not path.startswith('/api/') and isinstance(response, cls)
-            for cls in [StreamingHttpResponse, TemplateResponse, HttpResponseRedirect, HttpResponseBase]
-        ]):
-            return response
-
-        try:
-            content = response.content
-            is_json = 'application/json' in response.get('Content-Type')
+        logger.debug("%s.process_response => Request: %s, Response:%s", self.__class__.__name__, request, response)
 
-            # 网页、模板、重定向 直接返回
-            if not is_json and re.compile(rb"<!DOCTYPE").search(content):
-                return response
+        if isinstance(response, Response):
+            # rest_framework 响应(未使用 ApiJSONRenderer)
+            raw_data = response.data
+            if raw_data is None:
+                raw_data = self.loads(response.content)
 
-            raw_data = getattr(response, "data", None) or json.loads(content)
-        except (TypeError, AttributeError, json.JSONDecodeError):
-            raw_data = {}
+            response.data = envelope(raw_data, response.status_code)
+            response._is_rendered = False
+            response.render()
 
-        data = dict(code=StatusEnum.OK.code, errmsg=StatusEnum.OK.msg, data=None)
+            return response
 
-        if status.is_success(response.status_code):
-            data.update(data=raw_data)
-        else:
-            code = raw_data.pop("code", None) or response.status_code
-            data.update(code=code, errmsg=str(raw_data.pop("message", "")))
+        content = response.content
+        is_json = 'application/json' in response.get('Content-Type', '')
 
-        if not isinstance(response, Response):
-            # Django.http.response.JsonResponse
-            response = JsonResponse(data=data)
-        else:
-            # rest_framework 标准响应
-            response.data = data
-            response._is_rendered = False
+        # 网页、模板、重定向 直接返回
+        if not is_json and b"<!DOCTYPE" in content:
+            return response
 
-        if hasattr(response, "render"):
-            response.render()
+        # Django.http.response.JsonResponse
+        return ApiJsonResponse(data=envelope(self.loads(content), response.status_code), enveloped=True)
 
-        return response
+    @staticmethod
+    def loads(content):
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError):
+            return {}
@@ -1,13 +1,21 @@
+import time
+import hashlib
 import logging
+import threading
 import traceback
+from functools import lru_cache
+from collections import OrderedDict
 
 from django.core import signing
 from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse, NoReverseMatch, is_valid_path
 from django.http import HttpResponseRedirect
 from django.contrib.auth import get_user_model
-from django.utils.functional import cached_property
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import cached_property, SimpleLazyObject
 from django.utils.deprecation import MiddlewareMixin
+from django_redis import get_redis_connection
 
 from rest_framework.request import Request
 from rest_framework_simplejwt.settings import api_settings
@@ -21,48 +29,193 @@ User = get_user_model()
 logger = logging.getLogger('django')
 
 
+@lru_cache(maxsize=4)
+def get_cipher(salt):
+    """ AESCipher 无状态(每次加解密新建 AES 对象), 按 salt 复用, 不必每次请求重新处理秘钥 """
+    return AESCipher(salt)
+
+
+class AuthTokenCache:
+    """ 认证 Cookie 缓存: 密文 -> (user_id, token 过期时间)
+
+    进程内为有界 LRU(短 TTL, 默认 5 秒), Redis 中为共享副本(至 token 过期), 命中时跳过 AES 解密、JWT 校验与查询用户
+    登出时删除该 Cookie 的缓存; 修改密码、禁用、软删除(is_del)或删除用户时删除该用户全部 Cookie 的 Redis 缓存,
+    其他 worker 的进程内缓存最多在 {local_timeout} 秒后失效
+    """
+    cache_key = 'auth:token:%s'
+    user_cache_key = 'auth:user_tokens:%s'
+
+    def __init__(self, maxsize=1024, local_timeout=5.0):
+        self._maxsize = maxsize
+        self._local_timeout = local_timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+    def _get_local(self, token, now):
+        with self._lock:
+            try:
+                user_id, exp, expires_at = self._data[token]
+            except KeyError:
+                return None
+
+            if expires_at <= now:
+                del self._data[token]
+                return None
+
+            self._data.move_to_end(token)
+            return user_id, exp
+
+    def _set_local(self, token, user_id, exp, now):
+        expires_at = min(now + self._local_timeout, exp)
+
+        with self._lock:
+            self._data[token] = (user_id, exp, expires_at)
+            self._data.move_to_end(token)
+
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, token):
+        """ :return: (user_id, exp) 或 None, 已过期的 token 视为未命中 """
+        now = time.time()
+        value = self._get_local(token, now)
+
+        if value is None:
+            value = cache.get(self.cache_key % self.digest(token))
+
+            if value is None or value[1] <= now:
+                return None
+
+            self._set_local(token, *value, now)
+
+        return value
+
+    def set(self, token, user_id, exp):
+        now = time.time()
+        timeout = int(exp - now)
+
+        if timeout <= 0:
+            return
+
+        digest = self.digest(token)
+
+        cache.set(self.cache_key % digest, (user_id, exp), timeout=timeout)
+        # 用户的全部 Cookie 摘要(Redis Hash: 摘要 -> exp), 用于修改密码等场景的批量失效
+        # HSET 原子追加, 并发登录不会互相覆盖; 同一用户后签发的 token 过期时间不早于之前的, 按本次过期时间续期即可
+        user_cache_key = self.get_user_cache_key(user_id)
+        pipe = get_redis_connection().pipeline(transaction=True)
+        pipe.hset(user_cache_key, digest, int(exp))
+        pipe.expire(user_cache_key, timeout)
+        pipe.execute()
+
+        self._set_local(token, user_id, exp, now)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._data.pop(token, None)
+
+        cache.delete(self.cache_key % self.digest(token))
+
+    def invalidate_user(self, user_id):
+        # HKEYS + DEL 在同一事务中执行, 其间并发登录写入的摘要不会被漏删
+        pipe = get_redis_connection().pipeline(transaction=True)
+        pipe.hkeys(self.get_user_cache_key(user_id))
+        pipe.delete(self.get_user_cache_key(user_id))
+        digests = pipe.execute()[0]
+
+        digests and cache.delete_many([
+            self.cache_key % (digest.decode() if isinstance(digest, bytes) else digest) for digest in digests
+        ])
+
+        with self._lock:
+            for token in [token for token, value in self._data.items() if value[0] == user_id]:
+                del self._data[token]
+
+    def get_user_cache_key(self, user_id):
+        """ 直接操作 Redis 的键, 同样带上 Django 缓存的 KEY_PREFIX/VERSION """
+        return cache.make_key(self.user_cache_key % user_id)
+
+
+auth_token_cache = AuthTokenCache(
+    maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 1024),
+    local_timeout=getattr(settings, 'AUTH_TOKEN_CACHE_LOCAL_TIMEOUT', 5.0),
+)
+
+
 class Authentication(JWTAuthentication):
-    def authenticate(self, request: Request) -> AuthUser:
+    def get_token(self, request: Request):
         auth_cookie_key = settings.AUTH_COOKIE_KEY
         token = request.COOKIES.get(auth_cookie_key)
 
         if token is None:
             raise InvalidToken(' Cookie: %s is empty.' % auth_cookie_key)
 
-        plain_token = AESCipher(settings.AUTH_COOKIE_SALT).decrypt(token)
+        return token
+
+    def authenticate(self, request: Request) -> AuthUser:
+        token = self.get_token(request)
+        plain_token = get_cipher(settings.AUTH_COOKIE_SALT).decrypt(token)
         validated_token = self.get_validated_token(raw_token=plain_token)
+        user = self.get_user(validated_token)
+
+        auth_token_cache.set(token, getattr(user, api_settings.USER_ID_FIELD), validated_token['exp'])
+        return user
 
-        return self.get_user(validated_token)
+    def authenticate_cached(self, request: Request) -> AuthUser:
+        """ 优先使用缓存, 命中时返回懒加载的用户(访问属性时才查询数据库)
+
+        修改密码、禁用或删除用户时缓存已失效, 这里不再重复校验 is_active; 用户已不存在时视为匿名用户
+        """
+        token = self.get_token(request)
+        value = auth_token_cache.get(token)
+
+        if value is None:
+            return self.authenticate(request)
+
+        user_id = value[0]
+        return SimpleLazyObject(
+            lambda: User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first() or AnonymousUser()
+        )
 
 
 class AuthorizeMiddleware(MiddlewareMixin):
     """ 用户登录认证校验 """
 
+    @cached_property
+    def authentication(self):
+        return Authentication()
+
     @cached_property
     def exempt_request_paths(self):
-        attr = "_exempt_request_paths"
+        """ 前缀元组, 供 str.startswith 一次匹配 """
         view_names = [
             "login", "admin_password_reset",
         ]
+        exempt_paths = ['/favicon.ico']
 
-        if attr not in self.__dict__:
-            exempt_paths = ['/favicon.ico']
-
-            for view_name in view_names:
-                try:
-                    exempt_paths.append(reverse(view_name))
-                except NoReverseMatch:
-                    pass
-
+        for view_name in view_names:
             try:
-                exempt_paths.append(reverse("static", kwargs=dict(path="/")))
+                exempt_paths.append(reverse(view_name))
             except NoReverseMatch:
                 pass
 
-            self.__dict__[attr] = exempt_paths
-            return exempt_paths
+        try:
+            exempt_paths.append(reverse("static", kwargs=dict(path="/")))
+        except NoReverseMatch:
+            pass
+
+        # reload_javascript(bundle=True) 的合并脚本, 登录页等匿名页面同样需要
+        try:
+            bundle_url = reverse("generics_script_bundle", kwargs=dict(script_dirs="src", digest="0"))
+            exempt_paths.append(bundle_url.rsplit("/", 1)[0] + "/")
+        except NoReverseMatch:
+            pass
 
-        return self.__dict__[attr]
+        return tuple(exempt_paths)
 
     def _exempt_csrf_token(self, request):
         # Avoid error: rest_framework.exceptions.PermissionDenied:
@@ -82,7 +235,7 @@ class AuthorizeMiddleware(MiddlewareMixin):
         # if not is_valid_path(path):
         #     return HttpResponseRedirect(reverse("monitor_inner_404"))
 
-        if any([path.startswith(prefix_path) for prefix_path in self.exempt_request_paths]):
+        if path.startswith(self.exempt_request_paths):
             return
 
         # 如果设置 AUTHORIZATION 请求头，无需进行用户验证(由simplejwt进行鉴权)
@@ -90,7 +243,7 @@ class AuthorizeMiddleware(MiddlewareMixin):
             return
 
         try:
-            request.user = Authentication().authenticate(request)
+            request.user = self.authentication.authenticate_cached(request)
         except (AuthenticationFailed, TokenError, InvalidToken):
             logger.error(traceback.format_exc())
         except User.DoesNotExist:
@@ -1,30 +1,177 @@
 import re
-import json
-from typing import Union
+import hashlib
+import threading
+from collections import OrderedDict
 
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
-from django.utils.html import strip_spaces_between_tags
+
+
+class WhitespaceCompactor:
+    """ 单遍、流式(按 bytes 块)的 HTML 空白压缩
+
+        1. 删除标签之间(`>` 与 `<` 之间)以及首尾的空白
+        2. 连续空白合并为一个: 含换行时为 `\\n`, 否则为空格
+        3. 删除注释 <!--...-->
+        4. <pre>/<textarea>/<script>/<style> 的内容原样输出
+        5. 标签内只合并引号外的空白, 引号内的属性值(如 title="a  b")原样输出
+
+    直接处理 bytes(ASCII 空白不会出现在 UTF-8 多字节字符中), 块边界上不完整的空白、注释、标签留到下一块处理
+    """
+    TOKEN_REGEX = re.compile(rb'(<!--)|<(pre|textarea|script|style)(?=[\s/>])|(<[A-Za-z/])|(\s+)', re.I)
+    # 标签结束的 `>`, 跳过引号内的 `>`
+    TAG_END_REGEX = re.compile(rb'(?:"[^"]*"|\'[^\']*\'|[^\'">])*>')
+    TAG_PART_REGEX = re.compile(rb'("[^"]*"|\'[^\']*\')|\s+')
+    RAW_END_REGEXES = {
+        tag: re.compile(rb'</' + tag + rb'\s*>', re.I) for tag in (b'pre', b'textarea', b'script', b'style')
+    }
+    COMMENT_END = b'-->'
+    # 未完成的 `<!--`, `<textarea` 最长 9 个字节
+    TAIL_SIZE = 9
+
+    def __init__(self):
+        self._buffer = b''
+        self._last = b''
+
+    def _emit(self, output, data):
+        if data:
+            output.append(data)
+            self._last = data[-1:]
+
+    def _compact_tag(self, tag):
+        return self.TAG_PART_REGEX.sub(lambda m: m.group(1) or (b'\n' if b'\n' in m.group(0) else b' '), tag)
+
+    def _compact(self, final):
+        data, pos, output = self._buffer, 0, []
+
+        for match in self.TOKEN_REGEX.finditer(data):
+            start = match.start()
+
+            if start < pos:
+                continue
+
+            self._emit(output, data[pos:start])
+            pos = start
+
+            if match.group(1):
+                end = data.find(self.COMMENT_END, match.end())
+
+                if end == -1:
+                    if not final:
+                        break
+
+                    end = len(data) - len(self.COMMENT_END)
+
+                pos = end + len(self.COMMENT_END)
+            elif match.group(2):
+                end_match = self.RAW_END_REGEXES[match.group(2).lower()].search(data, match.end())
+
+                if end_match is None:
+                    if not final:
+                        break
+
+                    self._emit(output, data[start:])
+                    pos = len(data)
+                    break
+
+                self._emit(output, data[start:end_match.end()])
+                pos = end_match.end()
+            elif match.group(3):
+                end_match = self.TAG_END_REGEX.match(data, match.end())
+
+                if end_match is None:
+                    if not final:
+                        break
+
+                    self._emit(output, data[start:])
+                    pos = len(data)
+                    break
+
+                self._emit(output, self._compact_tag(data[start:end_match.end()]))
+                pos = end_match.end()
+            else:
+                end = match.end()
+
+                if end == len(data) and not final:
+                    break
+
+                # 开头、结尾与标签之间的空白直接删除
+                if self._last and end < len(data) and not (self._last == b'>' and data[end:end + 1] == b'<'):
+                    self._emit(output, b'\n' if b'\n' in match.group(4) else b' ')
+
+                pos = end
+        else:
+            # 可能被块边界截断的 `<!--` 或 `<script` 等
+            tail = data.rfind(b'<', max(pos, len(data) - self.TAIL_SIZE))
+            keep = tail if tail != -1 and not final else len(data)
+            self._emit(output, data[pos:keep])
+            pos = keep
+
+        self._buffer = data[pos:]
+        return b''.join(output)
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        return self._compact(final=False)
+
+    def close(self):
+        return self._compact(final=True)
+
+    def compact_iter(self, chunks):
+        for chunk in chunks:
+            data = self.feed(chunk)
+
+            if data:
+                yield data
+
+        data = self.close()
+
+        if data:
+            yield data
+
+    async def acompact_iter(self, chunks):
+        async for chunk in chunks:
+            data = self.feed(chunk)
+
+            if data:
+                yield data
+
+        data = self.close()
+
+        if data:
+            yield data
+
+    @classmethod
+    def compact(cls, content):
+        compactor = cls()
+        return compactor.feed(content) + compactor.close()
 
 
 class SpacelessMiddleware(MiddlewareMixin):
-    """  Remove Spaces between HTML tags with Spaceless """
+    """  Remove Spaces between HTML tags with Spaceless
+
+    可缓存的页面按内容指纹缓存压缩结果(进程内 LRU), 同一模板渲染出相同内容时不再重复压缩
+    """
     force_spaceless = False
     HTML_CONTENT_TYPE = 'text/html'
 
-    SPACE_REGEX = re.compile(r' +?', re.M | re.S)
-    LINE_BREAK_REGEX = re.compile(r'\n+?', re.M | re.S)
-    COMMENT_REGEX = re.compile(r'<!--.*?-->', re.M | re.S)
-    VUE_TEMPLATE_REGEX = re.compile(r'<template>.*?</template>', re.M | re.S)
+    DOCTYPE_REGEX = re.compile(rb'<!DOCTYPE', re.I)
+    VUE_TEMPLATE_REGEX = re.compile(rb'<template>.*?</template>', re.M | re.S)
+
+    memoize_size = getattr(settings, 'SPACELESS_CACHE_SIZE', 64)
+    memoize_max_length = getattr(settings, 'SPACELESS_CACHE_MAX_LENGTH', 1024 * 1024)
+    _memoized = OrderedDict()
+    _memoize_lock = threading.Lock()
 
     def can_spaceless(self, response):
         if self.is_html(response):
             return True
 
-        if self.is_vue(response.content):
-            return True
+        # 流式响应不读取内容
+        if response.streaming:
+            return False
 
-        return False
+        return self.is_vue(response.content)
 
     def is_html(self, response):
         content_type = response.get('Content-Type')
@@ -35,30 +182,66 @@ class SpacelessMiddleware(MiddlewareMixin):
         if self.HTML_CONTENT_TYPE in content_type:
             return True
 
-        return bool(re.compile(rb"<!DOCTYPE").search(response.content))
+        return not response.streaming and bool(self.DOCTYPE_REGEX.search(response.content))
 
-    def is_vue(self, content: Union[bytes, str]):
+    def is_vue(self, content):
         """ Mixed Content maybe have Html to Vue """
-        if isinstance(content, bytes):
-            content = content.decode()
+        if isinstance(content, str):
+            content = content.encode()
 
         return bool(self.VUE_TEMPLATE_REGEX.search(content))
 
-    def clean_whitespaces(self, content: Union[bytes, str]):
-        if isinstance(content, bytes):
-            content = content.decode()
+    @staticmethod
+    def is_cacheable(request, response):
+        """ 只缓存 GET/HEAD 且未禁止缓存(no-store/private)的页面, 避免在内存中保留用户私有内容 """
+        cache_control = response.get('Cache-Control', '')
+        return request.method in ('GET', 'HEAD') and 'no-store' not in cache_control and 'private' not in cache_control
+
+    def clean_whitespaces(self, content, memoize=False):
+        if isinstance(content, str):
+            content = content.encode()
+
+        if not memoize or len(content) > self.memoize_max_length:
+            return WhitespaceCompactor.compact(content)
+
+        fingerprint = hashlib.blake2b(content, digest_size=16).digest()
+        cls = self.__class__
+
+        with cls._memoize_lock:
+            compacted = cls._memoized.get(fingerprint)
 
-        content = strip_spaces_between_tags(content.strip())        # remove HTML spaces between tags
-        content = self.COMMENT_REGEX.sub("", content)               # remove HTML comment, like, eg <!--...-->
-        content = self.SPACE_REGEX.sub(" ", content)                # remove HTML verbose spaces
+            if compacted is not None:
+                cls._memoized.move_to_end(fingerprint)
+                return compacted
 
-        repl = "" if self.is_vue(content) else r'\n'
-        content = self.LINE_BREAK_REGEX.sub(repl, content)  # replace linebreak
+        compacted = WhitespaceCompactor.compact(content)
 
-        return content
+        with cls._memoize_lock:
+            cls._memoized[fingerprint] = compacted
+
+            while len(cls._memoized) > self.memoize_size:
+                cls._memoized.popitem(last=False)
+
+        return compacted
 
     def process_response(self, request, response):
-        if response.status_code == 200 and self.can_spaceless(response):
-            response.content = self.clean_whitespaces(response.content)
+        if response.status_code != 200 or not self.can_spaceless(response):
+            return response
+
+        if response.streaming:
+            compactor = WhitespaceCompactor()
+
+            if getattr(response, 'is_async', False):
+                response.streaming_content = compactor.acompact_iter(response.streaming_content)
+            else:
+                response.streaming_content = compactor.compact_iter(response.streaming_content)
+
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            response.content = self.clean_whitespaces(response.content, memoize=self.is_cacheable(request, response))
+
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(response.content))
 
         return response
@@ -13,13 +13,13 @@ from django.utils.functional import Promise
 from django.utils.html import format_html
 from django.utils.encoding import force_str as force_text
 from django.utils.safestring import mark_safe
-from django.templatetags.static import static
 from django.utils.translation import gettext_lazy as _
 from django.db.models.fields.related import ForeignKey
 from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.admin.templatetags.admin_urls import add_preserved_filters
 
-from permissions.models import RoleGroupModel
+from core.staticfiles import script_manifest
+from permissions.resolver import get_menus_script
 
 register = template.Library()
 
@@ -115,75 +115,25 @@ def get_filtered_menus(menus, user_permissions):
 @register.simple_tag(takes_context=True)
 def menus(context):
     """ 控制左侧菜单栏、上侧面包屑与面包屑对应的tab页 """
-    menus_data = []
-
-    # 自定义Django应用(目前已被Vue+ElementUI定制化替代)
-    app_list = context.get('app_list', [])
-    for app in app_list:
-        _models = [
-            {
-                'name': m.get('name'),
-                'icon': get_icon(m.get('object_name'), m.get('name')),
-                'url': m.get('admin_url'),
-                'addUrl': m.get('add_url'),
-                'breadcrumbs': [
-                    {
-                        'name': app.get('name'),
-                        'icon': get_icon(app.get('app_label'), app.get('name'))
-                    },
-                    {
-                        'name': m.get('name'),
-                        'icon': get_icon(m.get('object_name'), m.get('name'))
-                    }
-                ]
-            }
-            for m in app.get('models')
-        ] if app.get('models') else []
-
-        module = {
-            'name': app.get('name'),
-            'icon': get_icon(app.get('app_label'), app.get('name')),
-            'models': _models
-        }
-        menus_data.append(module)
-
-    # 菜单栏权限控制（ MenuOwnerPermissionModel 中授予的菜单权限）
-    user_id = context.request.user.id
-    menus_config = RoleGroupModel.get_menu_permissions(
-        user_id=user_id,
+    # 自定义Django应用的 app_list 菜单已被Vue+ElementUI定制化替代, 只使用菜单权限配置
+    # 菜单栏权限控制（ MenuOwnerPermissionModel 中授予的菜单权限）, 菜单部分按 (角色组, 权限版本) 预先序列化
+    menus_json, script = get_menus_script(
+        user_id=context.request.user.id,
         group_id=int(context.request.COOKIES.get('cgid') or 0),  # 当前用户使用的用户组(Cookie)
     )
-    group_id = menus_config.pop('group_id')
-    menus_data = menus_config.get('menus')
-
-    # 给每个菜单增加一个唯一标识，用于tab页判断
-    eid = 1000
-    handler_eid(menus_data, eid)
-    menus_string = json.dumps(menus_data, cls=LazyEncoder)
 
     # 把data放入session中，其他地方可以调用
     if not isinstance(context, dict) and context.request:
         if "_menus" not in context.request.session:
-            context.request.session['_menus'] = menus_string
-
-    # 计算用户所属的角色组
-    groups = RoleGroupModel.get_group_list(user_id=user_id, first_id=group_id)
-    groups_string = json.dumps(groups, cls=LazyEncoder)
+            context.request.session['_menus'] = menus_json.decode('utf-8')
 
-    return '<script type="text/javascript">' \
-           'var menus={menus};' \
-           'var userGroups={groups};' \
-           'var currentGroupId={group_id};' \
-           '</script>'.format(menus=menus_string, groups=groups_string, group_id=group_id)
+    return '<script type="text/javascript">{script}</script>'.format(script=script.decode('utf-8'))
 
 
-def handler_eid(data, eid):
-    for i in data:
-        eid += 1
-        i['eid'] = eid
-        if 'models' in i:
-            eid = handler_eid(i.get('models'), eid)
-    return eid
+@register.simple_tag(takes_context=True)
+def menus_script(context):
+    """ 外链的菜单栏脚本(与 menus 内容相同), 浏览器按 ETag 缓存, 切换页面时不再重复下载 """
+    return format_html('<script type="text/javascript" src="{}"></script>', reverse('permissions_menus_script'))
 
 
 def get_icon(obj, name=None):
@@ -394,28 +344,13 @@ def get_variable_name(k=10):
 
 
 @register.simple_tag(takes_context=True)
-def reload_javascript(context, script_dirs=None):
-    """ reload `api, components, utils, views` scripts """
-    scripts = []
-    exclude_files = ['login.js']
-    script_dirs = [d.strip() for d in (script_dirs or '').split(',') if d.strip()]
-
-    for static_dir in settings.STATICFILES_DIRS:
-        for root, dirs, files in os.walk(static_dir, topdown=False):
-            static_path = root[len(static_dir) + 1:]
+def reload_javascript(context, script_dirs=None, bundle=None):
+    """ reload `api, components, utils, views` scripts
 
-            try:
-                entry, pathname = static_path.split(os.sep, 2)[:2]
-            except ValueError:
-                continue
-
-            if entry == 'src' and pathname in script_dirs:
-                for filename in files:
-                    if filename in exclude_files:
-                        continue
-
-                    static_src = os.path.join('/', static_path, filename).replace(os.sep, '/')
-                    scripts.append(f'<script type="text/javascript" src="{static(static_src)}"></script>')
-
-    return "\n".join(scripts)
+    脚本清单在 collectstatic/启动时生成并缓存(core.staticfiles.script_manifest), 不再每次渲染遍历静态目录
+    bundle=True(默认 settings.RELOAD_JAVASCRIPT_BUNDLE)时合并为一个内容哈希命名的脚本
+    """
+    script_dirs = tuple(d.strip() for d in (script_dirs or '').split(',') if d.strip())
+    bundle = getattr(settings, 'RELOAD_JAVASCRIPT_BUNDLE', False) if bundle is None else bundle
 
+    return script_manifest.render(script_dirs, bundle=bundle)